@@ -17,4 +17,10 @@ setup(
         'h5py',
         'mahotas',
             ],
+    entry_points = {
+        'console_scripts': [
+            'skelerator-benchmark = skelerator.benchmark:main',
+            'skelerator-dataset = skelerator.dataset:main',
+            ],
+        },
 )   
@@ -2,4 +2,5 @@ from .tree import Tree
 from .skeleton import Skeleton
 from .neuron import Neuron
 from .forest import create_segmentation
+from .blockwise import create_segmentation_blockwise
 from .batch_provider import BatchProvider
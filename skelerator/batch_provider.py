@@ -1,19 +1,76 @@
+import asyncio
 import time
+import traceback
 import numpy as np
 import  multiprocessing
+import queue
+from multiprocessing import shared_memory
 from skelerator import create_segmentation
+from skelerator.forest import sample_outputs
+from skelerator.profiling import StageProfiler, NullProfiler
 import pdb
 import h5py
 
+# Arrays a batch can contain, the cropped ones are cut to shape_out:
+batch_outputs = ["raw", "skeletons", "segmentation", "raw_cropped", "skeletons_cropped", "segmentation_cropped"]
+batch_dtypes = {"raw": np.dtype(bool), "skeletons": np.dtype(bool), "segmentation": np.dtype(np.uint32)}
 
 class BatchProvider(object):
-    def __init__(self, 
+    def __init__(self,
                  shape_in,
                  shape_out,
                  interpolation,
                  smoothness,
                  n_workers=8,
-                 verbose=False):
+                 verbose=False,
+                 noise_strength=0.,
+                 transport="queue",
+                 n_slots=None,
+                 prefetch=None,
+                 seed=None,
+                 profile=False,
+                 outputs=None,
+                 n_samples=None,
+                 cache=None):
+        """
+        Generates batches of toy segmentations in a pool of
+        long-lived background processes. The pool is started with
+        the first call to next_batch and keeps a bounded queue of
+        prefetched batches filled until finished() is called or the
+        provider is used as a context manager and the block exits.
+
+        Args:
+
+        transport: How batches are handed from the workers to the consumer.
+                   "queue" pickles the arrays through a multiprocessing queue,
+                   "shared_memory" writes them into a ring of preallocated
+                   shared memory slots and only passes the slot index. Batches
+                   are then returned as SharedBatch views that have to be
+                   released once consumed.
+
+        n_slots: Number of shared memory slots, defaults to n_workers + prefetch.
+
+        prefetch: Number of finished batches kept ready in the queue,
+                  defaults to 2 * n_workers.
+
+        seed: Global seed of all generated samples. Every sample gets a
+              unique index from a counter shared by the workers and is
+              generated with create_segmentation(..., seed=seed, sample_index=index),
+              see Batch.sample_indices. Defaults to fresh OS entropy.
+
+        profile: Record per stage times of all workers, see get_statistics.
+
+        outputs: Names of the arrays of each batch, in this order, from batch_outputs.
+                 Defaults to all six: raw, skeletons, segmentation and their cropped
+                 versions. Only the samples' outputs these need are computed, see
+                 create_segmentation, and only these arrays are transported.
+
+        n_samples: Cycle through the sample indices 0 to n_samples - 1 instead of generating
+                   new samples forever, e.g. for a fixed validation set.
+
+        cache: A skelerator.cache.SampleCache (or its directory) shared by all workers,
+               see create_segmentation. Only useful together with n_samples and seed.
+        """
 
         self.shape = np.array(shape_in)
         self.shape_out = np.array(shape_out)
@@ -21,69 +78,278 @@ class BatchProvider(object):
             raise ValueError("Output shape needs to be smaller than input shape")
         if np.any((self.shape - self.shape_out) % 2 != 0):
             raise ValueError("Input shape minus output shape must be divisible by 2 in all dimensions")
+        if not transport in ["queue", "shared_memory"]:
+            raise ValueError("Choose between queue or shared_memory transport")
         self.interpolation = interpolation
         self.smoothness = smoothness
+        self.noise_strength = noise_strength
         self.n_workers = n_workers
         self.verbose = verbose
+        self.transport = transport
+        self.prefetch = prefetch if prefetch is not None else 2 * n_workers
+        self.n_slots = n_slots if n_slots is not None else n_workers + self.prefetch
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.profile = profile
+        self.profiler = StageProfiler()
+        self.n_samples = n_samples
+        self.cache = cache
+        self.outputs = list(batch_outputs if outputs is None else outputs)
+        for output in self.outputs:
+            if not output in batch_outputs:
+                raise ValueError("Unknown output {}, choose from {}".format(output, batch_outputs))
+        self.sample_outputs = [output for output in sample_outputs
+                               if output in self.outputs or output + "_cropped" in self.outputs]
 
-        self.queue = multiprocessing.Queue(50)
-        self.worker_queue = multiprocessing.Queue(n_workers)
+        self.queue = multiprocessing.Queue(self.prefetch)
+        # Batch size, number of objects and points per skeleton
+        # the workers currently generate batches for:
+        self.request = multiprocessing.Array("l", 3)
+        self.stop = multiprocessing.Event()
+        self.sample_counter = multiprocessing.Value("l", 0)
         self.done = False
+        # Error message of the first failed worker, the provider is unusable after it:
+        self.error = None
         self.processes = []
+        self.ring = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.finished()
 
     def next_batch(self,
                    batch_size,
                    n_objects,
-                   points_per_skeleton):
+                   points_per_skeleton,
+                   timeout=None):
+        """
+        Returns the next batch for the given parameters. Changing
+        the parameters between calls is supported, batches that were
+        prefetched for the previous parameters are discarded.
+
+        Raises a TimeoutError if no batch arrives within timeout seconds
+        and a RuntimeError with the worker's traceback if generating a
+        sample failed or a worker died, on this and every later call.
+        """
 
         if self.verbose:
             print("Request batch...")
-        if not self.queue.full() and not self.worker_queue.full():
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        if self.done:
+            raise RuntimeError("Batch provider is finished")
+
+        request = (batch_size, n_objects, points_per_skeleton)
+        if self.transport == "shared_memory":
+            if self.ring is None:
+                self.ring = SharedMemoryRing(self.n_slots, self.get_batch_layout(batch_size))
+            elif self.ring.layout != self.get_batch_layout(batch_size):
+                raise ValueError("Shared memory transport requires a constant batch size")
+
+        with self.request.get_lock():
+            self.request[:] = request
+
+        if not self.processes:
             if self.verbose:
-                print("Queue not full, spawn workers...")
+                print("Start workers...")
             for i in range(self.n_workers):
-                p = multiprocessing.Process(target=self.queue_next_batch, args=(batch_size, n_objects, points_per_skeleton,))
+                p = multiprocessing.Process(target=self.work)
+                p.daemon = True
                 p.start()
                 self.processes.append(p)
-                #self.queue_next_batch(batch_size, n_objects, points_per_skeleton, seed + i)
 
-        batch = self.queue.get()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            batch_request, sample_indices, batch, statistics = self.get_item(deadline)
+            if batch_request is None:
+                self.error = "Batch generation failed in a worker:\n" + batch
+                raise RuntimeError(self.error)
+            if statistics is not None:
+                self.profiler.merge(statistics)
+            if batch_request == request:
+                break
+            if self.transport == "shared_memory":
+                self.ring.free_slots.put(batch)
+
+        if self.transport == "shared_memory":
+            batch = SharedBatch(self.ring.get_arrays(batch), sample_indices, self.outputs, batch, self.ring.free_slots)
+        else:
+            batch = Batch(batch, sample_indices, self.outputs)
         return batch
 
-    def queue_next_batch(self, 
+    def get_item(self, deadline):
+        """
+        Next item of the queue, waits in short intervals
+        to notice workers that are no longer alive.
+        """
+        while True:
+            dead = [p for p in self.processes if not p.is_alive()]
+            if dead:
+                # A worker that failed in create_segmentation queued its
+                # traceback before exiting, prefer it over the exit code:
+                for i in range(self.prefetch + self.n_workers):
+                    try:
+                        item = self.queue.get(timeout=0.1)
+                    except queue.Empty:
+                        break
+                    if item[0] is None:
+                        return item
+                    if self.transport == "shared_memory":
+                        self.ring.free_slots.put(item[2])
+                self.error = "Worker {} died with exit code {}".format(dead[0].pid, dead[0].exitcode)
+                raise RuntimeError(self.error)
+
+            wait = 1.
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    raise TimeoutError("No batch was generated in time")
+            try:
+                return self.queue.get(timeout=wait)
+            except queue.Empty:
+                pass
+
+    def iterate(self,
+                batch_size,
+                n_objects,
+                points_per_skeleton,
+                n_batches=None,
+                timeout=None):
+        """
+        Generator of n_batches batches (endless if None) for the given
+        parameters, see next_batch. The workers keep up to prefetch
+        batches ready while the consumer processes the current one.
+        With the shared memory transport every batch is released
+        when the next one is requested.
+        """
+        batch = None
+        i = 0
+        try:
+            while n_batches is None or i < n_batches:
+                if isinstance(batch, SharedBatch):
+                    batch.release()
+                batch = self.next_batch(batch_size, n_objects, points_per_skeleton, timeout=timeout)
+                i += 1
+                yield batch
+        finally:
+            if isinstance(batch, SharedBatch):
+                batch.release()
+
+    async def aiterate(self,
+                       batch_size,
+                       n_objects,
+                       points_per_skeleton,
+                       n_batches=None,
+                       timeout=None):
+        """
+        Asynchronous version of iterate for async for loops, waits
+        for the next batch in a thread of the event loop's executor.
+        """
+        loop = asyncio.get_running_loop()
+        batches = self.iterate(batch_size, n_objects, points_per_skeleton, n_batches, timeout)
+        future = None
+        try:
+            while True:
+                future = loop.run_in_executor(None, next, batches, None)
+                batch = await asyncio.shield(future)
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            if future is not None and not future.done():
+                # Cancelled while the generator runs in the executor,
+                # it can only be closed (and its batch released) once it returns:
+                await asyncio.wait([future])
+            batches.close()
+
+    def get_statistics(self):
+        """
+        Running per stage statistics over all samples the workers generated
+        so far (including prefetched ones), see StageProfiler.get_statistics.
+        Requires profile=True.
+        """
+        return self.profiler.get_statistics()
+
+    def get_batch_layout(self, batch_size):
+        """
+        Shape and dtype of each of the requested arrays of a batch.
+        """
+        layout = []
+        for output in self.outputs:
+            shape = self.shape_out if output.endswith("_cropped") else self.shape
+            layout.append(((batch_size,) + tuple(shape), batch_dtypes[output.replace("_cropped", "")]))
+        return layout
+
+    def work(self):
+        """
+        Worker loop, generates batches for the currently
+        requested parameters until the provider is stopped.
+        """
+        if self.verbose:
+            print("Worker started")
+
+        while not self.stop.is_set():
+            with self.request.get_lock():
+                request = tuple(self.request[:])
+            try:
+                self.queue_next_batch(*request)
+            except Exception:
+                # Hand the error to the consumer instead of dying silently:
+                self.put((None, None, traceback.format_exc(), None))
+                return
+
+    def queue_next_batch(self,
                          batch_size,
                          n_objects,
                          points_per_skeleton):
 
-        self.worker_queue.put(1)
+        if self.transport == "shared_memory":
+            slot = None
+            while slot is None:
+                try:
+                    slot = self.ring.free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    if self.stop.is_set():
+                        return
+            batch = self.ring.get_arrays(slot)
+        else:
+            batch = [np.empty(shape, dtype=dtype) for shape, dtype in self.get_batch_layout(batch_size)]
 
-        if self.verbose:
-            print("Worker started")
+        with self.sample_counter.get_lock():
+            first_index = self.sample_counter.value
+            self.sample_counter.value += batch_size
+        sample_indices = list(range(first_index, first_index + batch_size))
+        if self.n_samples is not None:
+            sample_indices = [index % self.n_samples for index in sample_indices]
 
-        batch_raw = []
-        batch_skel = []
-        batch_seg = []
-        batch_raw_out = []
-        batch_skel_out = []
-        batch_seg_out = []
-
-        k = 0
-        for batch in range(batch_size):
-            batch = create_segmentation(self.shape, n_objects, points_per_skeleton, self.interpolation, self.smoothness, seed=int(time.time()/((k+1)*3)))
-            batch_raw.append(batch["raw"].astype("bool"))
-            batch_skel.append(batch["skeletons"].astype("bool"))
-            batch_seg.append(batch["segmentation"].astype(np.uint32))
-            batch_raw_out.append(self.crop(batch["raw"]).astype("bool"))
-            batch_skel_out.append(self.crop(batch["skeletons"].astype("bool")))
-            batch_seg_out.append(self.crop(batch["segmentation"].astype(np.uint32)))
-            k += 1
+        profiler = StageProfiler() if self.profile else NullProfiler()
+        for b, sample_index in enumerate(sample_indices):
+            sample = create_segmentation(self.shape, n_objects, points_per_skeleton, self.interpolation, self.smoothness, self.noise_strength, seed=self.seed, sample_index=sample_index, profiler=profiler, outputs=self.sample_outputs, cache=self.cache)
+            with profiler.stage("crop"):
+                for array, output in zip(batch, self.outputs):
+                    if output.endswith("_cropped"):
+                        array[b] = self.crop(sample[output.replace("_cropped", "")])
+                    else:
+                        array[b] = sample[output]
+        statistics = profiler.get_statistics() if self.profile else None
 
         if self.verbose:
             print("Add batch to queue...")
 
-        self.queue.put([np.stack(batch_raw), np.stack(batch_skel), np.stack(batch_seg), 
-                        np.stack(batch_raw_out), np.stack(batch_skel_out), np.stack(batch_seg_out)])
-        self.worker_queue.get()
+        if self.transport == "shared_memory":
+            del batch
+            batch = slot
+
+        self.put(((batch_size, n_objects, points_per_skeleton), sample_indices, batch, statistics))
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
 
     def crop(self, y):
         lower = ((self.shape - self.shape_out)/2).astype(int)
@@ -92,23 +358,116 @@ class BatchProvider(object):
         return y
 
     def finished(self):
+        if self.done:
+            return
         if self.verbose:
             print("Batch generation finished. Exiting.")
         self.done = True
+        self.stop.set()
+
+        # Workers exit after their current batch; drain the
+        # queue so that none of them blocks on a full pipe:
+        deadline = time.time() + 10
+        while any(p.is_alive() for p in self.processes) and time.time() < deadline:
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
         for p in self.processes:
-            p.terminate()
+            if p.is_alive():
+                p.terminate()
             p.join()
+        self.processes = []
+
+        if self.ring is not None:
+            self.ring.close()
+
+
+class SharedMemoryRing(object):
+    def __init__(self, n_slots, layout):
+        """
+        A fixed number of shared memory slots, each large
+        enough to hold one batch with the given layout
+        of (shape, dtype) pairs. Indices of unused slots
+        are kept in the free_slots queue.
+        """
+        self.layout = layout
+        self.offsets = []
+        nbytes = 0
+        for shape, dtype in layout:
+            # Keep every array cache line aligned:
+            nbytes += -nbytes % 64
+            self.offsets.append(nbytes)
+            nbytes += int(np.prod(shape)) * dtype.itemsize
+
+        self.slots = [shared_memory.SharedMemory(create=True, size=max(nbytes, 1)) for i in range(n_slots)]
+        self.free_slots = multiprocessing.Queue()
+        for slot in range(n_slots):
+            self.free_slots.put(slot)
+
+    def get_arrays(self, slot):
+        buf = self.slots[slot].buf
+        return [np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+                for (shape, dtype), offset in zip(self.layout, self.offsets)]
+
+    def close(self):
+        for shm in self.slots:
+            try:
+                shm.close()
+            except BufferError:
+                # Batches that were not released still hold views:
+                pass
+            shm.unlink()
+
+
+class Batch(list):
+    def __init__(self, arrays, sample_indices, names=None):
+        """
+        The arrays of a batch together with the
+        sample index each of its samples was generated with.
+        Arrays can also be looked up by name, e.g. batch["segmentation_cropped"].
+        """
+        list.__init__(self, arrays)
+        self.sample_indices = sample_indices
+        self.names = list(batch_outputs if names is None else names)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return list.__getitem__(self, self.names.index(key))
+        return list.__getitem__(self, key)
+
+    def as_dict(self):
+        return dict(zip(self.names, self))
+
+
+class SharedBatch(Batch):
+    def __init__(self, arrays, sample_indices, names, slot, free_slots):
+        """
+        A batch of arrays that are views into a shared memory slot.
+        The data is only valid until release() hands the slot
+        back to the workers.
+        """
+        Batch.__init__(self, arrays, sample_indices, names)
+        self.slot = slot
+        self.free_slots = free_slots
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            del self[:]
+            self.free_slots.put(self.slot)
+            self.released = True
+
 
 if __name__ == "__main__":
-    bp = BatchProvider([100,100,100],
+    with BatchProvider([100,100,100],
                        [50, 50, 50],
                        "linear",
-                       2.0)
-
-    for i in range(5):
-        batch = bp.next_batch(2, 10, 5)
-        f = h5py.File("./test_crop_{}.h5".format(i))
-        f.create_dataset("x", data=batch[0][0])
-        dset = f.create_dataset("y", data=batch[-1][0].astype(np.uint32))
-        dset.attrs.create("offset", np.array([25,25,25]))
-    bp.finished()
+                       2.0) as bp:
+
+        for i in range(5):
+            batch = bp.next_batch(2, 10, 5)
+            f = h5py.File("./test_crop_{}.h5".format(i))
+            f.create_dataset("x", data=batch[0][0])
+            dset = f.create_dataset("y", data=batch[-1][0].astype(np.uint32))
+            dset.attrs.create("offset", np.array([25,25,25]))
@@ -0,0 +1,264 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from skelerator import Tree, Skeleton, Neuron, create_segmentation, BatchProvider
+from skelerator.forest import get_sampling_region
+from skelerator.profiling import StageProfiler
+
+benchmarks = ["tree", "skeleton", "neuron", "neuron_draw", "create_segmentation", "batch_provider"]
+
+def get_peak_rss():
+    """
+    Peak resident set size in MB of this process and, separately,
+    of the largest of its terminated child processes. Both are
+    high-water marks over the whole lifetime of the process.
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS:
+    scale = 1024.**2 if sys.platform == "darwin" else 1024.
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+def time_calls(setup, call, repeats):
+    """
+    Returns the wall times of repeats calls of call(setup(i)).
+    Only call is timed.
+    """
+    times = []
+    for i in range(repeats):
+        args = setup(i)
+        start = time.perf_counter()
+        call(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+def run_case(benchmark, shape, n_objects, points_per_skeleton, interpolation, repeats, n_workers=1, batch_size=1,
+             isolate=True):
+    """
+    Runs one benchmark for one parameter combination and returns a
+    record with its parameters, times in seconds and throughput, see
+    measure_case. With isolate, the case runs in a freshly spawned
+    process, such that the peak RSS is that of this case alone and
+    not the high-water mark of all cases run before.
+    """
+    args = (benchmark, shape, n_objects, points_per_skeleton, interpolation, repeats, n_workers, batch_size)
+    if not isolate:
+        return measure_case(*args)
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(measure_case, *args).result()
+
+def get_stage_statistics(time_profiler, allocation_profiler=None):
+    """
+    Mean and maximal wall time and mean output size per stage
+    and, if given, the peak allocation per stage of a traced run.
+    """
+    stages = {}
+    for name, stats in time_profiler.get_statistics().items():
+        stages[name] = {"mean": stats["time"] / stats["count"],
+                        "max": stats["max_time"],
+                        "output_mb": stats["nbytes"] / stats["count"] / 1024.**2}
+    if allocation_profiler is not None:
+        for name, stats in allocation_profiler.get_statistics().items():
+            if name in stages:
+                stages[name]["peak_allocated_mb"] = stats["max_allocated"] / 1024.**2
+    return stages
+
+def measure_case(benchmark, shape, n_objects, points_per_skeleton, interpolation, repeats, n_workers=1, batch_size=1):
+    """
+    Runs one benchmark in the current process. The tree, skeleton and
+    neuron benchmarks time a single object with as many points as
+    create_segmentation samples per object. The create_segmentation
+    and batch_provider benchmarks also report per stage times, the
+    former together with the peak allocation per stage of one
+    additional, untimed run with traced allocations.
+    """
+    region, n_points = get_sampling_region(shape, points_per_skeleton)
+    samples = 1
+    stages = None
+
+    def sample_points(i):
+        rng = np.random.default_rng(i)
+        return rng.integers(0, region[::-1, None], (3, n_points)).T, rng
+
+    if benchmark == "tree":
+        times = time_calls(lambda i: (sample_points(i)[0],), Tree, repeats)
+
+    elif benchmark == "skeleton":
+        def setup(i):
+            points, rng = sample_points(i)
+            return Tree(points), rng
+        times = time_calls(setup,
+                           lambda tree, rng: Skeleton(tree, [1,1,1], interpolation, rng=rng),
+                           repeats)
+
+    elif benchmark == "neuron":
+        def setup(i):
+            points, rng = sample_points(i)
+            return Skeleton(Tree(points), [1,1,1], interpolation, rng=rng), rng
+        times = time_calls(setup, lambda skeleton, rng: Neuron(skeleton, 2, 5, rng=rng), repeats)
+
+    elif benchmark == "neuron_draw":
+        def setup(i):
+            points, rng = sample_points(i)
+            neuron = Neuron(Skeleton(Tree(points), [1,1,1], interpolation, rng=rng), 2, 5, rng=rng)
+            canvas, offset = neuron.get_minimal_canvas()
+            return neuron, canvas, offset
+        times = time_calls(setup, lambda neuron, canvas, offset: neuron.draw(canvas, offset), repeats)
+
+    elif benchmark == "create_segmentation":
+        def call(i, profiler):
+            create_segmentation(shape, n_objects, points_per_skeleton, interpolation, 2, 1.,
+                                seed=0, sample_index=i, profiler=profiler)
+        time_profiler = StageProfiler()
+        times = time_calls(lambda i: (i, time_profiler), call, repeats)
+        allocation_profiler = StageProfiler(trace_allocations=True)
+        call(0, allocation_profiler)
+        stages = get_stage_statistics(time_profiler, allocation_profiler)
+
+    elif benchmark == "batch_provider":
+        samples = batch_size
+        with BatchProvider(shape, shape, interpolation, 2, n_workers=n_workers, noise_strength=1., seed=0,
+                           profile=True) as bp:
+            # The first batch includes the start up of the workers:
+            bp.next_batch(batch_size, n_objects, points_per_skeleton)
+            times = time_calls(lambda i: (), lambda: bp.next_batch(batch_size, n_objects, points_per_skeleton), repeats)
+            # Stage times of all samples the workers generated, prefetched ones included:
+            stages = get_stage_statistics(bp.profiler)
+
+    else:
+        raise ValueError("Unknown benchmark {}, choose from {}".format(benchmark, benchmarks))
+
+    rss, children_rss = get_peak_rss()
+    record = {"benchmark": benchmark,
+              "shape": [int(s) for s in shape],
+              "n_objects": n_objects,
+              "points_per_skeleton": points_per_skeleton,
+              "interpolation": interpolation,
+              "times": times,
+              "best": min(times),
+              "mean": float(np.mean(times)),
+              "samples_per_second": samples / float(np.mean(times)),
+              "peak_rss_mb": rss,
+              "peak_children_rss_mb": children_rss}
+    if stages is not None:
+        record["stages"] = stages
+    if benchmark == "batch_provider":
+        record["n_workers"] = n_workers
+        record["batch_size"] = batch_size
+    return record
+
+def get_key(record):
+    return tuple(json.dumps(record.get(k)) for k in ["benchmark", "shape", "n_objects", "points_per_skeleton",
+                                                     "interpolation", "n_workers", "batch_size"])
+
+def run(benchmarks=benchmarks,
+        shapes=[(64,64,64)],
+        n_objects=[10],
+        points_per_skeleton=[5],
+        interpolations=["linear", "random"],
+        n_workers=[1],
+        batch_size=2,
+        repeats=3,
+        isolate=True,
+        verbose=False):
+    """
+    Sweeps all combinations of the given parameters and returns
+    a JSON serializable report with one record per run.
+    n_workers is only swept for the batch_provider benchmark.
+    Each run gets its own process unless isolate is False, see run_case.
+    """
+    records = []
+    for benchmark in benchmarks:
+        workers = n_workers if benchmark == "batch_provider" else [1]
+        for shape, n, pps, interpolation, w in itertools.product(shapes, n_objects, points_per_skeleton,
+                                                                  interpolations, workers):
+            record = run_case(benchmark, shape, n, pps, interpolation, repeats, n_workers=w, batch_size=batch_size,
+                              isolate=isolate)
+            if verbose:
+                print(format_record(record))
+            records.append(record)
+
+    return {"version": get_version(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "records": records}
+
+def get_version():
+    try:
+        from importlib.metadata import version
+        return version("skelerator")
+    except Exception:
+        return None
+
+def format_record(record, baseline=None):
+    line = "{:<20} shape={} n_objects={} pps={} {:<7}".format(record["benchmark"], record["shape"],
+                                                             record["n_objects"], record["points_per_skeleton"],
+                                                             record["interpolation"])
+    if "n_workers" in record:
+        line += " n_workers={}".format(record["n_workers"])
+    line += " best={:.4f}s {:.2f} samples/s peak_rss={:.0f}MB".format(record["best"], record["samples_per_second"],
+                                                                     record["peak_rss_mb"])
+    if baseline is not None:
+        line += " speedup={:.2f}x rss_change={:+.0f}MB".format(baseline["best"] / record["best"],
+                                                              record["peak_rss_mb"] - baseline["peak_rss_mb"])
+    for name, stage in record.get("stages", {}).items():
+        line += "\n    {:<20} mean={:.4f}s max={:.4f}s out={:.1f}MB".format(name, stage["mean"], stage["max"],
+                                                                          stage["output_mb"])
+        if "peak_allocated_mb" in stage:
+            line += " peak_allocated={:.1f}MB".format(stage["peak_allocated_mb"])
+    return line
+
+def compare(report, baseline):
+    """
+    Prints every record of report next to its speedup over
+    the record with the same parameters in baseline.
+    """
+    baseline_records = {get_key(r): r for r in baseline["records"]}
+    for record in report["records"]:
+        print(format_record(record, baseline_records.get(get_key(record))))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the skelerator generation pipeline.")
+    parser.add_argument("--benchmarks", nargs="+", choices=benchmarks, default=benchmarks)
+    parser.add_argument("--shape", nargs=3, type=int, action="append", dest="shapes",
+                        help="Volume shape, can be given multiple times (default 64 64 64)")
+    parser.add_argument("--n-objects", nargs="+", type=int, default=[10])
+    parser.add_argument("--points-per-skeleton", nargs="+", type=int, default=[5])
+    parser.add_argument("--interpolation", nargs="+", choices=["linear", "random"], default=["linear", "random"])
+    parser.add_argument("--n-workers", nargs="+", type=int, default=[1])
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="Run all cases in this process, peak RSS is then cumulative over the cases")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    report = run(benchmarks=args.benchmarks,
+                 shapes=args.shapes or [(64,64,64)],
+                 n_objects=args.n_objects,
+                 points_per_skeleton=args.points_per_skeleton,
+                 interpolations=args.interpolation,
+                 n_workers=args.n_workers,
+                 batch_size=args.batch_size,
+                 repeats=args.repeats,
+                 isolate=not args.no_isolate,
+                 verbose=args.compare is None)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
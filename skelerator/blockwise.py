@@ -0,0 +1,190 @@
+import itertools
+import numpy as np
+import h5py
+from scipy.ndimage import gaussian_filter, distance_transform_edt
+from skimage.segmentation import find_boundaries
+
+from skelerator.forest import sample_skeletons, get_margin
+from skelerator.seeding import get_seed_sequence
+from skelerator.writer import get_label_dtype
+from skelerator.postprocessing import suppress_non_maxima, add_noise
+from skelerator.watershed import watershed, get_context_box
+
+# Noise is drawn per cell of this shape, independent of the block shape:
+noise_cell_shape = np.array([64, 64, 64])
+
+def create_segmentation_blockwise(shape,
+                                  n_objects,
+                                  points_per_skeleton,
+                                  interpolation,
+                                  smoothness,
+                                  noise_strength,
+                                  write_to,
+                                  block_shape=(256,256,256),
+                                  halo=32,
+                                  seed=0,
+                                  sample_index=0,
+                                  margin=None,
+                                  verbose=False):
+    """
+    Creates a toy segmentation like create_segmentation, but
+    block by block such that the volume never has to fit into memory.
+
+    Skeletons are placed globally (with the same random streams as
+    create_segmentation) and only kept as sparse voxel lists. Noise,
+    non max suppression, distance transform, watershed and boundaries are then
+    computed for each block extended by halo voxels on each side, and the
+    block core is written to the output. Labels are the global object ids,
+    so they agree across blocks without relabeling. Results near block
+    faces match a global computation as long as the halo is larger than
+    the distance from any voxel to its closest skeleton and than 4 * smoothness.
+
+    Args:
+
+    write_to: Path of an HDF5 file that receives chunked, compressed datasets
+              segmentation, skeletons (both with the smallest unsigned type
+              that holds n_objects labels) and boundaries. Alternatively a dict
+              of already created array-like datasets (h5py, zarr, np.memmap)
+              with these keys, each of the given shape.
+
+    block_shape: Shape of the blocks processed at a time, also used as chunk shape.
+
+    halo: Context in voxels added to each side of a block. It is doubled for
+          blocks without any skeleton voxel within it until they contain one.
+
+    margin: Padding of the region skeleton points are sampled in, see create_segmentation.
+    """
+    shape = np.array(shape)
+    if len(shape) != 3:
+        raise ValueError("Provide 3D shape.")
+    if np.any(shape % 2 != 0):
+        raise ValueError("All shape dimensions have to be even.")
+    block_shape = np.minimum(np.array(block_shape), shape)
+
+    noise_seed, objects_seed = get_seed_sequence(seed, sample_index).spawn(2)
+    voxels, labels = get_skeleton_voxels(shape, n_objects, points_per_skeleton, interpolation, objects_seed, margin)
+    if verbose:
+        print("Placed {} skeleton voxels of {} objects".format(len(voxels), n_objects))
+
+    f = None
+    if isinstance(write_to, dict):
+        datasets = write_to
+    else:
+        f = h5py.File(write_to, "w")
+        chunks = tuple(int(c) for c in block_shape)
+        label_dtype = get_label_dtype(n_objects)
+        datasets = {"segmentation": f.create_dataset("segmentation", shape=tuple(shape), dtype=label_dtype,
+                                                     chunks=chunks, compression="gzip"),
+                    "skeletons": f.create_dataset("skeletons", shape=tuple(shape), dtype=label_dtype,
+                                                  chunks=chunks, compression="gzip"),
+                    "boundaries": f.create_dataset("boundaries", shape=tuple(shape), dtype=bool,
+                                                   chunks=chunks, compression="gzip")}
+
+    try:
+        # Bucket the skeleton voxels by the block they fall into:
+        grid = -(-shape // block_shape)
+        block_of_voxel = np.ravel_multi_index(tuple((voxels // block_shape).T), grid)
+        order = np.argsort(block_of_voxel, kind="stable")
+        voxels = voxels[order]
+        labels = labels[order]
+        bucket_offsets = np.searchsorted(block_of_voxel[order], np.arange(np.prod(grid) + 1))
+
+        for block in itertools.product(*[range(g) for g in grid]):
+            block = np.array(block)
+            core_begin = block * block_shape
+            core_end = np.minimum(core_begin + block_shape, shape)
+            target = tuple(slice(b, e) for b, e in zip(core_begin, core_end))
+            if verbose:
+                print("Process block {} of {}...".format(block, grid))
+
+            def get_seed_voxels(begin, end):
+                return get_voxels_in_box(voxels, labels, bucket_offsets, grid, block_shape, begin, end)
+            context = get_context_box(core_begin, core_end, shape, halo,
+                                      lambda begin, end: len(get_seed_voxels(begin, end)[0]) > 0)
+            if context is None:
+                # No skeleton is inside the volume at all:
+                for name in ["segmentation", "skeletons", "boundaries"]:
+                    datasets[name][target] = 0
+                continue
+            begin, end = context
+
+            seeds = np.zeros(end - begin, dtype=np.uint32)
+            block_voxels, block_labels = get_seed_voxels(begin, end)
+            seeds[tuple((block_voxels - begin).T)] = block_labels
+
+            suppress_non_maxima(seeds, size=4)
+            seeds_dt = distance_transform_edt(seeds==0)
+            if noise_strength != 0:
+                noise = get_noise(noise_seed, noise_cell_shape, begin, end)
+                add_noise(seeds_dt, gaussian_filter(noise, sigma=smoothness), noise_strength)
+            segmentation = watershed(seeds_dt, seeds, backend="mahotas")
+            boundaries = find_boundaries(segmentation)
+
+            core = tuple(slice(b, e) for b, e in zip(core_begin - begin, core_end - begin))
+            datasets["segmentation"][target] = segmentation[core]
+            datasets["skeletons"][target] = seeds[core]
+            datasets["boundaries"][target] = boundaries[core]
+    finally:
+        if f is not None:
+            f.close()
+
+def get_skeleton_voxels(shape, n_objects, points_per_skeleton, interpolation, objects_seed, margin=None):
+    """
+    Returns the skeleton voxels inside the output volume as (N, 3) array in
+    array (z, y, x) order together with their labels. Where skeletons overlap
+    the later object wins, as when drawing them one after the other.
+    """
+    margin = get_margin(shape, margin)
+
+    voxels = []
+    labels = []
+    for label, skeleton in sample_skeletons(shape, n_objects, points_per_skeleton, interpolation, objects_seed, margin):
+        points = skeleton.get_points()[:, ::-1] - margin
+        points = points[np.all((points >= 0) & (points < shape), axis=1)]
+        voxels.append(points)
+        labels.append(np.full(len(points), label, dtype=np.uint32))
+
+    voxels = np.concatenate(voxels) if voxels else np.zeros((0, 3), dtype=int)
+    labels = np.concatenate(labels) if labels else np.zeros(0, dtype=np.uint32)
+
+    # Keep the last occurrence of every voxel:
+    _, last = np.unique(np.ravel_multi_index(tuple(voxels.T), shape)[::-1], return_index=True)
+    keep = len(voxels) - 1 - last
+    return voxels[keep], labels[keep]
+
+def get_voxels_in_box(voxels, labels, bucket_offsets, grid, block_shape, begin, end):
+    first_block = begin // block_shape
+    last_block = (end - 1) // block_shape
+    ranges = [range(a, b + 1) for a, b in zip(first_block, last_block)]
+
+    block_voxels = []
+    block_labels = []
+    for block in itertools.product(*ranges):
+        i = np.ravel_multi_index(block, grid)
+        candidates = voxels[bucket_offsets[i]:bucket_offsets[i+1]]
+        inside = np.all((candidates >= begin) & (candidates < end), axis=1)
+        block_voxels.append(candidates[inside])
+        block_labels.append(labels[bucket_offsets[i]:bucket_offsets[i+1]][inside])
+    return np.concatenate(block_voxels), np.concatenate(block_labels)
+
+def get_noise(noise_seed, cell_shape, begin, end):
+    """
+    Noise in the box [begin, end) assembled from cells of cell_shape.
+    Each cell is drawn from its own child of noise_seed, such that
+    overlapping boxes of neighbouring blocks see identical noise.
+    """
+    noise = np.empty(end - begin)
+    first_cell = begin // cell_shape
+    last_cell = (end - 1) // cell_shape
+    for cell in itertools.product(*[range(a, b + 1) for a, b in zip(first_cell, last_cell)]):
+        cell = np.array(cell)
+        cell_seed = np.random.SeedSequence(noise_seed.entropy,
+                                           spawn_key=noise_seed.spawn_key + tuple(int(c) for c in cell))
+        cell_noise = np.abs(np.random.default_rng(cell_seed).standard_normal(tuple(cell_shape)))
+
+        cell_begin = cell * cell_shape
+        lo = np.maximum(cell_begin, begin)
+        hi = np.minimum(cell_begin + cell_shape, end)
+        noise[tuple(slice(a, b) for a, b in zip(lo - begin, hi - begin))] = \
+            cell_noise[tuple(slice(a, b) for a, b in zip(lo - cell_begin, hi - cell_begin))]
+    return noise
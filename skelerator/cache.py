@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+
+class SampleCache(object):
+    def __init__(self, directory, max_bytes=2**30):
+        """
+        Stores generated samples as .npy files in directory, one
+        subdirectory per sample named by the hash of its generation
+        parameters. Hits are served as read-only memory maps without
+        copying. Once the cache grows beyond max_bytes the least recently
+        used samples are evicted. Several processes can share a directory,
+        entries are written to a temporary directory and renamed into place.
+
+        Args:
+
+        directory: Cache directory, created if missing.
+
+        max_bytes: Upper bound of the total size of all cached samples.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, parameters):
+        """
+        Key of a sample generated with the JSON serializable dict of parameters.
+        """
+        return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, names):
+        """
+        Memory maps of the arrays names of the sample key as dict, or
+        None if the sample or one of the arrays is not cached.
+        """
+        path = self.get_path(key)
+        try:
+            arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in names}
+            # The modification time of an entry is its last use:
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            # Missing, partially evicted or replaced while reading:
+            return None
+        return arrays
+
+    def put(self, key, arrays):
+        """
+        Stores the dict of arrays as sample key, replacing
+        a previous entry, and evicts old samples if needed.
+        """
+        path = self.get_path(key)
+        tmp_path = os.path.join(self.directory, ".tmp-{}".format(uuid.uuid4().hex))
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, name + ".npy"), array)
+
+        old_path = None
+        if os.path.exists(path):
+            old_path = os.path.join(self.directory, ".old-{}".format(uuid.uuid4().hex))
+            try:
+                os.rename(path, old_path)
+            except FileNotFoundError:
+                old_path = None
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process stored the same sample in the meantime:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+        self.evict()
+
+    def get_entries(self):
+        """
+        (last use, size in bytes, key) of all cached samples.
+        """
+        entries = []
+        for key in os.listdir(self.directory):
+            if key.startswith("."):
+                continue
+            path = self.get_path(key)
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, key))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def nbytes(self):
+        return sum(size for _, size, _ in self.get_entries())
+
+    def evict(self):
+        """
+        Removes the least recently used samples until
+        the cache is no larger than max_bytes.
+        """
+        entries = sorted(self.get_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self.get_path(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for key in os.listdir(self.directory):
+            shutil.rmtree(self.get_path(key), ignore_errors=True)
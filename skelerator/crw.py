@@ -1,38 +1,95 @@
+import itertools
 import numpy as np
 import matplotlib.pyplot as plt
 
+from skelerator.seeding import get_rng
+
+def get_move_table(dim):
+    """
+    All moves to the 3**dim - 1 neighbouring voxels
+    on a 2D or 3D grid together with their squared length.
+    """
+    moves = np.array([m for m in itertools.product((-1,0,1), repeat=dim) if any(m)], dtype=int)
+    return moves, np.sum(moves**2, axis=1)
+
+def random_walks(edges, rng):
+    """
+    Run one constrained random walk per edge, advancing
+    all walks in lockstep.
+
+    Args:
+
+    edges: Array of shape (E, 2, dim) holding start and end point of each walk.
+
+    rng: np.random.Generator the moves are drawn from.
+
+    Returns:
+
+    points: Array of shape (N, dim) with the voxels of all walks concatenated,
+            start and end point included.
+
+    offsets: Array of shape (E + 1,), walk i covers points[offsets[i]:offsets[i+1]].
+    """
+    edges = np.asarray(edges, dtype=int)
+    if edges.ndim != 3 or edges.shape[1] != 2 or not edges.shape[2] in (2, 3):
+        raise NotImplementedError("Provide 2 or 3 dimensional start & endpoints")
+
+    moves, moves_sq = get_move_table(edges.shape[2])
+    p = np.copy(edges[:, 0])
+    end = edges[:, 1]
+
+    walk_ids = [np.arange(len(edges))]
+    walk_points = [np.copy(p)]
+    active = np.flatnonzero(np.any(p != end, axis=1))
+    while len(active):
+        """
+        Moving by a from p decreases the distance to the end point e iff
+        |p + a - e|^2 < |p - e|^2 <=> 2 a.(p - e) + |a|^2 < 0,
+        which is evaluated for all moves of all active walks with one product.
+        Moving towards e along the sign of e - p is always possible.
+        Drawing a uniform key per move and picking the largest valid one
+        chooses uniformly among the possible moves.
+        """
+        possible_moves = 2 * np.dot(p[active] - end[active], moves.T) + moves_sq < 0
+        keys = rng.random(possible_moves.shape)
+        keys[~possible_moves] = -1.
+        p[active] += moves[np.argmax(keys, axis=1)]
+
+        walk_ids.append(active)
+        walk_points.append(p[active])
+        active = active[np.any(p[active] != end[active], axis=1)]
+
+    walk_ids = np.concatenate(walk_ids)
+    order = np.argsort(walk_ids, kind="stable")
+    points = np.concatenate(walk_points)[order]
+
+    offsets = np.zeros(len(edges) + 1, dtype=int)
+    np.cumsum(np.bincount(walk_ids, minlength=len(edges)), out=offsets[1:])
+    return points, offsets
+
 class ConstrainedRandomWalk(object):
-    def __init__(self, start, end):
+    def __init__(self, start, end, rng=None):
         """
         Interpolate two points on a 2D or 3D
-        voxel grid by taking random moves from 
-        the start point to any 
+        voxel grid by taking random moves from
+        the start point to any
         of the neighboring voxels that decrease
         the distance to the end point.
         """
-        self.start = start
-        self.end = end
-
-        if len(self.start) == len(self.end) == 3:
-            self.adjacency = [(i,j,k) for i in (-1,0,1) for j in (-1,0,1) for k in (-1,0,1) if not (i == j == k == 0)]
-        elif len(self.start) == len(self.end) == 2:
-            self.adjacency = [(i,j) for i in (-1,0,1) for j in (-1,0,1) if not (i == j == 0)]
-        else:
+        self.start = np.array(start, dtype=int)
+        self.end = np.array(end, dtype=int)
+
+        self.rng = get_rng(rng)
+
+        if not (len(self.start) == len(self.end) and len(self.start) in (2, 3)):
             raise NotImplementedError("Provide 2 or 3 dimensional start & endpoints")
 
     def walk(self):
-        line = []
-        line.append(np.copy(self.start))
-        p = np.copy(self.start)
-
-        while not np.all(p == self.end):
-            possible_moves = [adj for adj in self.adjacency if (np.linalg.norm((p + adj) - self.end) < np.linalg.norm(p - self.end))]
-            if not possible_moves:
-                raise ValueError("No possible moves")
-
-            move = possible_moves[np.random.randint(0, len(possible_moves))]
-            p += move
-            line.append(np.copy(p))
+        """
+        Returns the walk as an (N, dim) int array,
+        including start and end point.
+        """
+        line, _ = random_walks(np.array([[self.start, self.end]]), self.rng)
 
         assert(np.all(line[0] == self.start))
         assert(np.all(line[-1] == self.end))
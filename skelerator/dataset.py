@@ -0,0 +1,166 @@
+import argparse
+import json
+import multiprocessing
+import os
+
+from skelerator import create_segmentation
+from skelerator.writer import SampleWriter
+
+def get_shard_path(output_dir, shard):
+    return os.path.join(output_dir, "shard_{:05d}.h5".format(shard))
+
+def get_sample_group(sample_index):
+    return "sample_{:08d}".format(sample_index)
+
+def get_shard_samples(n_samples, n_shards, shard):
+    """
+    Sample indices stored in shard, samples are
+    distributed round robin over all shards.
+    """
+    return range(shard, n_samples, n_shards)
+
+def generate_shard(output_dir, shard, n_samples, n_shards, parameters, write_debug=False, verbose=False):
+    """
+    Generates all samples of one shard that are not complete yet. The shard
+    file is only ever opened by one process. Every sample is written to its
+    own group, which gets a "complete" attribute once all its datasets are
+    written, together with its sample index, seed and parameters. Groups of
+    samples that were interrupted while writing are regenerated.
+    Returns the number of generated samples.
+    """
+    path = get_shard_path(output_dir, shard)
+    try:
+        writer = SampleWriter(path, mode="a")
+    except OSError:
+        # The file was corrupted by a run that was killed while writing:
+        os.replace(path, path + ".corrupt")
+        writer = SampleWriter(path, mode="a")
+
+    n_generated = 0
+    with writer:
+        stored_parameters = writer.file.attrs.get("parameters")
+        if stored_parameters is None:
+            writer.file.attrs["parameters"] = json.dumps(parameters, sort_keys=True)
+            writer.file.attrs["n_shards"] = n_shards
+        elif json.loads(stored_parameters) != parameters or writer.file.attrs["n_shards"] != n_shards:
+            raise ValueError("Shard {} was generated with different parameters or number of shards".format(path))
+        writer.file.attrs["complete"] = False
+
+        for sample_index in get_shard_samples(n_samples, n_shards, shard):
+            group = get_sample_group(sample_index)
+            if group in writer:
+                if writer.file[group].attrs.get("complete", False):
+                    continue
+                del writer.file[group]
+
+            create_segmentation(parameters["shape"],
+                                parameters["n_objects"],
+                                parameters["points_per_skeleton"],
+                                parameters["interpolation"],
+                                parameters["smoothness"],
+                                parameters["noise_strength"],
+                                write_to=writer,
+                                seed=parameters["seed"],
+                                sample_index=sample_index,
+                                write_debug=write_debug,
+                                write_group=group)
+
+            attrs = writer.file[group].attrs
+            attrs["sample_index"] = sample_index
+            attrs["seed"] = str(parameters["seed"])
+            attrs["parameters"] = json.dumps(parameters, sort_keys=True)
+            attrs["complete"] = True
+            writer.flush()
+            n_generated += 1
+            if verbose:
+                print("Generated sample {} in {}".format(sample_index, path))
+
+        writer.file.attrs["complete"] = True
+    return n_generated
+
+def generate_shard_task(args):
+    return generate_shard(*args)
+
+def generate_dataset(output_dir,
+                     n_samples,
+                     shape,
+                     n_objects,
+                     points_per_skeleton,
+                     interpolation,
+                     smoothness,
+                     noise_strength,
+                     seed=0,
+                     n_shards=None,
+                     n_workers=None,
+                     write_debug=False,
+                     verbose=False):
+    """
+    Generates n_samples samples with create_segmentation(..., seed=seed,
+    sample_index=i) in a pool of n_workers processes and distributes them over
+    n_shards HDF5 files in output_dir, each written by a single worker.
+    Rerunning with the same arguments resumes an interrupted run, samples
+    that are complete are kept.
+
+    Args:
+
+    n_shards: Number of output files, defaults to n_workers. Use at least
+              as many shards as workers to keep all of them busy.
+
+    n_workers: Number of processes, defaults to the number of cores.
+    """
+    n_workers = n_workers if n_workers is not None else os.cpu_count()
+    n_shards = n_shards if n_shards is not None else n_workers
+    parameters = {"shape": [int(s) for s in shape],
+                  "n_objects": int(n_objects),
+                  "points_per_skeleton": int(points_per_skeleton),
+                  "interpolation": interpolation,
+                  "smoothness": float(smoothness),
+                  "noise_strength": float(noise_strength),
+                  "seed": int(seed)}
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    tasks = [(output_dir, shard, n_samples, n_shards, parameters, write_debug, verbose) for shard in range(n_shards)]
+    n_generated = 0
+    with multiprocessing.Pool(min(n_workers, n_shards)) as pool:
+        for shard_generated in pool.imap_unordered(generate_shard_task, tasks):
+            n_generated += shard_generated
+
+    if verbose:
+        print("Generated {} of {} samples".format(n_generated, n_samples))
+    return n_generated
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a fixed dataset of toy segmentations.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--n-samples", type=int, required=True)
+    parser.add_argument("--shape", nargs=3, type=int, default=[128, 128, 128])
+    parser.add_argument("--n-objects", type=int, default=50)
+    parser.add_argument("--points-per-skeleton", type=int, default=5)
+    parser.add_argument("--interpolation", choices=["linear", "random"], default="random")
+    parser.add_argument("--smoothness", type=float, default=2.)
+    parser.add_argument("--noise-strength", type=float, default=1.)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n-shards", type=int)
+    parser.add_argument("--n-workers", type=int)
+    parser.add_argument("--write-debug", action="store_true", help="Also write noise and distance transform")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    generate_dataset(args.output_dir,
+                     args.n_samples,
+                     args.shape,
+                     args.n_objects,
+                     args.points_per_skeleton,
+                     args.interpolation,
+                     args.smoothness,
+                     args.noise_strength,
+                     seed=args.seed,
+                     n_shards=args.n_shards,
+                     n_workers=args.n_workers,
+                     write_debug=args.write_debug,
+                     verbose=args.verbose)
+
+if __name__ == "__main__":
+    main()
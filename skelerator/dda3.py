@@ -2,7 +2,46 @@ import numpy as np
 import operator
 
 def dda_round(x):
-    return (x + 0.5).astype(int) 
+    return (x + 0.5).astype(int)
+
+def draw_lines(edges, scaling=np.array([1,1,1])):
+    """
+    Rasterize a batch of lines in one vectorized pass.
+
+    Args:
+
+    edges: Array of shape (E, 2, 3) holding start and end point of each line.
+
+    scaling: Voxel scaling applied to all end points before interpolation.
+
+    Returns:
+
+    points: Array of shape (N, 3) with the voxels of all lines concatenated,
+            identical to what DDA3 produces for each line.
+
+    offsets: Array of shape (E + 1,), line i covers points[offsets[i]:offsets[i+1]].
+    """
+    edges = np.asarray(edges)
+    if edges.ndim != 3 or edges.shape[1] != 2:
+        raise ValueError("Provide edges as an (E, 2, D) array")
+
+    start = (edges[:, 0] * scaling).astype(float)
+    end = (edges[:, 1] * scaling).astype(float)
+    max_length = np.max(np.abs(end - start), axis=1)
+    n_steps = max_length.astype(int)
+
+    dv = np.zeros(np.shape(start))
+    nonzero = max_length > 0
+    dv[nonzero] = (end[nonzero] - start[nonzero]) / max_length[nonzero, None]
+
+    offsets = np.zeros(len(edges) + 1, dtype=int)
+    np.cumsum(n_steps + 1, out=offsets[1:])
+
+    line_id = np.repeat(np.arange(len(edges)), n_steps + 1)
+    step = np.arange(offsets[-1]) - offsets[line_id]
+
+    points = dda_round(step[:, None] * dv[line_id] + start[line_id])
+    return points, offsets
 
 class DDA3:
     def __init__(self, start, end, scaling=np.array([1,1,1])):
@@ -12,18 +51,16 @@ class DDA3:
         self.start = (start * scaling).astype(float)
         self.end = (end * scaling).astype(float)
         self.line = [dda_round(self.start)]
-        
+
         self.max_direction, self.max_length = max(enumerate(abs(self.end - self.start)), key=operator.itemgetter(1))
 
-        try:
+        # Zero length lines consist of their start point only:
+        self.dv = np.zeros(np.shape(self.start))
+        if self.max_length > 0:
             self.dv = (self.end - self.start) / self.max_length
-        except RuntimeWarning:
-            print("max length:", self.max_length, "\n")
-            raise ValueError
-
 
-    def draw(self): 
-        for step in range(int(self.max_length)):
-            self.line.append(dda_round((step + 1) * self.dv + self.start))
 
+    def draw(self):
+        points, _ = draw_lines(np.array([[self.start, self.end]]))
+        self.line = list(points)
         return self.line
@@ -1,18 +1,137 @@
 import numpy as np
-from skimage.segmentation import mark_boundaries, find_boundaries
-from scipy.ndimage.filters import gaussian_filter
-from skelerator import Tree, Skeleton
-from mahotas import cwatershed
-import h5py
-from scipy.ndimage.morphology import distance_transform_edt
-from scipy.ndimage.filters import maximum_filter
-import matplotlib.pyplot as plt
-import sys
-import traceback
-import time
-import multiprocessing as mp
-
-def create_segmentation(shape, n_objects, points_per_skeleton, interpolation, smoothness, noise_strength, write_to=None, seed=0):
+from skimage.segmentation import find_boundaries
+from skelerator import Tree, Skeleton, Neuron
+from skelerator.skeleton import draw_points
+from skelerator.neuron import draw_neurons
+from skelerator.watershed import watershed
+from skelerator.noise import get_smoothed_noise
+from skelerator.postprocessing import suppress_non_maxima, seed_distance_transform, add_noise
+from skelerator.seeding import get_seed_sequence
+from skelerator.profiling import NullProfiler
+from skelerator.writer import SampleWriter
+from skelerator.cache import SampleCache
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Arrays create_segmentation can return, "raw" are the object boundaries:
+sample_outputs = ["segmentation", "skeletons", "raw"]
+
+def get_margin(shape, margin=None):
+    """
+    Returns the margin in voxels (per axis, in array order) that
+    is added on each side of the output volume when sampling
+    skeleton points. By default the sampling region is the
+    cube of twice the largest output dimension centered on
+    the output volume.
+    """
+    shape = np.array(shape)
+    if margin is None:
+        margin = (2*np.max(shape) - shape) // 2
+    margin = np.array(margin, dtype=int) * np.ones(len(shape), dtype=int)
+    if np.any(margin < 0):
+        raise ValueError("Margin must be non-negative.")
+    return margin
+
+def get_sampling_region(shape, points_per_skeleton, margin=None):
+    """
+    Returns the shape of the region skeleton points are sampled in, i.e. the
+    output volume padded by margin on each side (see get_margin), in array
+    order, together with the number of points sampled per object.
+    """
+    shape = np.array(shape)
+    margin = get_margin(shape, margin)
+    region = shape + 2*margin
+
+    """
+    The region is larger than the output volume to avoid border effects. To keep
+    the density of points the same as points_per_skeleton points in a cube of the
+    largest output dimension, the number of points is scaled with the volume of the region
+    (a factor of 8 = 2**3 for the default region of twice the largest output dimension).
+    """
+    n_points = int(round(points_per_skeleton * np.prod(region.astype(float)) / float(np.max(shape))**3))
+    n_points = max(n_points, 2)
+    return region, n_points
+
+def sample_skeleton(region, n_points, interpolation, object_seed):
+    """
+    Samples n_points in region and returns the skeleton
+    spanned by them, with all randomness drawn from object_seed.
+    """
+    rng = np.random.default_rng(object_seed)
+    # Points are (x, y, z), i.e. reversed array order:
+    points = rng.integers(0, region[::-1, None], (3, n_points)).T
+    tree = Tree(points)
+    return Skeleton(tree, [1,1,1], interpolation, generate_graph=False, rng=rng)
+
+def sample_neuron(region, n_points, interpolation, object_seed, min_radius, max_radius):
+    """
+    Like sample_skeleton, with the same skeleton for the same object_seed,
+    but returns a Neuron with radii between min_radius and max_radius.
+    """
+    rng = np.random.default_rng(object_seed)
+    points = rng.integers(0, region[::-1, None], (3, n_points)).T
+    tree = Tree(points)
+    skeleton = Skeleton(tree, [1,1,1], interpolation, rng=rng)
+    return Neuron(skeleton, min_radius, max_radius, rng=rng)
+
+def get_skeleton_points(region, n_points, interpolation, object_seed):
+    return sample_skeleton(region, n_points, interpolation, object_seed).get_points()
+
+def sample_skeletons(shape, n_objects, points_per_skeleton, interpolation, objects_seed, margin=None):
+    """
+    Yields label and skeleton of each object. Skeleton points are
+    sampled in the output volume padded by margin on each side
+    (see get_margin), and are given relative to the lower corner of
+    that padded region. Object i is drawn from the i-th child of the
+    seed sequence objects_seed.
+    """
+    region, n_points = get_sampling_region(shape, points_per_skeleton, margin)
+    for i, object_seed in enumerate(objects_seed.spawn(n_objects)):
+        yield i + 1, sample_skeleton(region, n_points, interpolation, object_seed)
+
+def sample_skeleton_points(shape, n_objects, points_per_skeleton, interpolation, objects_seed, margin=None, n_jobs=1, executor="thread"):
+    """
+    Like sample_skeletons, but yields label and the (N, 3) array of (x, y, z)
+    skeleton points of each object, optionally generated in a pool of
+    n_jobs threads or processes. Objects are yielded in label order and
+    every object keeps its own random stream, so the result does not
+    depend on n_jobs or executor.
+
+    Args:
+
+    n_jobs: Number of workers, None uses all cores.
+
+    executor: "thread" or "process". Processes scale better since tree
+              construction holds the GIL for a good part of its time, but
+              cannot be started from daemonic processes (e.g. BatchProvider workers).
+    """
+    region, n_points = get_sampling_region(shape, points_per_skeleton, margin)
+    object_seeds = objects_seed.spawn(n_objects)
+    if n_jobs is None:
+        n_jobs = os.cpu_count()
+
+    if n_jobs == 1 or n_objects <= 1:
+        for i, object_seed in enumerate(object_seeds):
+            yield i + 1, get_skeleton_points(region, n_points, interpolation, object_seed)
+        return
+
+    if executor == "thread":
+        pool = ThreadPoolExecutor(n_jobs)
+    elif executor == "process":
+        pool = ProcessPoolExecutor(n_jobs)
+    else:
+        raise ValueError("Choose between thread or process executor")
+
+    with pool:
+        all_points = pool.map(get_skeleton_points,
+                              [region] * n_objects,
+                              [n_points] * n_objects,
+                              [interpolation] * n_objects,
+                              object_seeds)
+        for i, points in enumerate(all_points):
+            yield i + 1, points
+
+def create_segmentation(shape, n_objects, points_per_skeleton, interpolation, smoothness, noise_strength, write_to=None, seed=0, sample_index=0, margin=None, n_jobs=1, executor="thread", dtype=np.float64, max_distance=None, watershed_backend="mahotas", noise_downsample=False, noise_filter="gaussian", profiler=None, write_debug=False, write_group=None, mode="watershed", min_radius=1, max_radius=4, outputs=None, cache=None):
     """
     
     Creates a toy segmentation containing skeletons.
@@ -30,68 +149,231 @@ def create_segmentation(shape, n_objects, points_per_skeleton, interpolation, sm
                    random (constrained random walk).
 
     smoothness: Controls the smoothness of the initial noise map used to generate object boundaries.
+
+    seed, sample_index: All randomness of the sample is drawn from independent streams
+                        spawned from np.random.SeedSequence(seed, spawn_key=(sample_index,)),
+                        such that the same pair always regenerates the same volume.
+
+    margin: Padding in voxels (int or per axis) around the output volume in which skeleton
+            points are sampled, at constant point density. Skeletons are clipped to the
+            output volume when drawn. Defaults to padding up to a cube of twice the
+            largest output dimension.
+
+    n_jobs, executor: Build the skeletons of the objects in a pool of n_jobs
+                      "thread" or "process" workers, see sample_skeleton_points.
+                      The result is the same for any number of workers.
+
+    dtype: Data type of the noise and the distance transform the watershed runs on,
+           np.float32 halves their memory.
+
+    max_distance: Clip the distance transform at max_distance voxels, which allows
+                  to compute it slab by slab with a much lower peak memory.
+                  Voxels further away from any skeleton than max_distance
+                  only see the noise, see seed_distance_transform.
+
+    watershed_backend: Implementation of the watershed, "mahotas", "skimage"
+                       or "blockwise", see skelerator.watershed.
+
+    noise_downsample, noise_filter: Generate the noise at reduced resolution and/or smooth
+                                    it with an FFT ("fft") instead of gaussian_filter ("gaussian"),
+                                    see skelerator.noise.get_smoothed_noise. No noise is generated
+                                    if noise_strength is 0.
+
+    profiler: A skelerator.profiling.StageProfiler that records time and output size
+              of each stage (noise, skeletons, rasterize, nms, distance_transform,
+              watershed, boundaries, write).
+
+    write_to: Path of an HDF5 file that is overwritten with the segmentation, skeletons and
+              boundaries, or a skelerator.writer.SampleWriter to append them to.
+              Datasets are chunked, compressed and use the narrowest sufficient dtype.
+
+    write_debug: Also write the smoothed noise and the distance transform.
+
+    write_group: Group to write the datasets to, e.g. one per sample.
+
+    mode: "watershed" grows the objects from their skeletons by a watershed on the distance
+          transform plus noise until they fill the volume. "neurons" instead renders each
+          object as a Neuron, i.e. as spheres around its skeleton with smoothly varying radii
+          between min_radius and max_radius, with background in between. Overlaps go to the
+          closest skeleton, see skelerator.neuron.draw_neurons. Noise is not used in this mode.
+
+    outputs: Subset of sample_outputs ("segmentation", "skeletons", "raw") to compute and
+             return, defaults to all. Stages only needed for the others are skipped,
+             e.g. the boundaries ("raw") if not requested and noise, distance transform
+             and watershed if only the skeletons are.
+
+    cache: A skelerator.cache.SampleCache (or its directory) to look the sample up in before
+           generating it and to store it with all outputs afterwards. Hits are returned as read-only memory
+           maps. Samples are keyed by all parameters that change them, samples without a seed
+           or with write_debug are never cached.
+    """
+    if not mode in ["watershed", "neurons"]:
+        raise ValueError("Choose between watershed or neurons mode")
+    outputs = sample_outputs if outputs is None else list(outputs)
+    for output in outputs:
+        if not output in sample_outputs:
+            raise ValueError("Unknown output {}, choose from {}".format(output, sample_outputs))
+    need_segmentation = "segmentation" in outputs or "raw" in outputs
+    if profiler is None:
+        profiler = NullProfiler()
+
+    shape = np.array(shape)
+    if len(shape) != 3:
+        raise ValueError("Provide 3D shape.")
+
+    if np.any(shape % 2 != 0):
+        raise ValueError("All shape dimensions have to be even.")
+
+    if cache is not None and seed is not None and not write_debug:
+        if not isinstance(cache, SampleCache):
+            cache = SampleCache(cache)
+        key = cache.get_key({"shape": [int(s) for s in shape],
+                             "n_objects": int(n_objects),
+                             "points_per_skeleton": int(points_per_skeleton),
+                             "interpolation": interpolation,
+                             "smoothness": float(smoothness),
+                             "noise_strength": float(noise_strength),
+                             "seed": int(seed),
+                             "sample_index": int(sample_index),
+                             "margin": None if margin is None else np.broadcast_to(margin, 3).tolist(),
+                             "dtype": np.dtype(dtype).str,
+                             "max_distance": None if max_distance is None else float(max_distance),
+                             "watershed_backend": watershed_backend,
+                             "noise_downsample": noise_downsample,
+                             "noise_filter": noise_filter,
+                             "mode": mode,
+                             "min_radius": float(min_radius),
+                             "max_radius": float(max_radius)})
+        with profiler.stage("cache"):
+            data = cache.get(key, outputs)
+        if data is None:
+            # Generate and store all outputs, such that callers requesting
+            # different outputs share the entry instead of replacing it:
+            data = create_segmentation(shape, n_objects, points_per_skeleton, interpolation, smoothness, noise_strength,
+                                       seed=seed, sample_index=sample_index, margin=margin, n_jobs=n_jobs,
+                                       executor=executor, dtype=dtype, max_distance=max_distance,
+                                       watershed_backend=watershed_backend, noise_downsample=noise_downsample,
+                                       noise_filter=noise_filter, profiler=profiler, mode=mode,
+                                       min_radius=min_radius, max_radius=max_radius)
+            with profiler.stage("cache"):
+                cache.put(key, data)
+            data = {name: data[name] for name in outputs}
+        return write_sample(data, None, None, n_objects, write_to, write_debug, write_group, profiler)
+
+    noise_seed, objects_seed = get_seed_sequence(seed, sample_index).spawn(2)
+    smoothed_noise = None
+    if noise_strength != 0 and mode == "watershed" and need_segmentation:
+        with profiler.stage("noise") as stage:
+            smoothed_noise = get_smoothed_noise(shape, smoothness, np.random.default_rng(noise_seed), dtype=dtype,
+                                                downsample=noise_downsample, method=noise_filter)
+            stage.add_output(smoothed_noise)
+
+    # Sample one tree for each object and draw the part of its skeleton inside the volume:
+    margin = get_margin(shape, margin)
+    if mode == "neurons":
+        segmentation, seeds, seeds_dt = render_neurons(shape, n_objects, points_per_skeleton, interpolation, objects_seed,
+                                                       margin, min_radius, max_radius, profiler,
+                                                       render=need_segmentation)
+        return write_sample(get_outputs(segmentation, seeds, outputs, profiler), smoothed_noise, seeds_dt, n_objects,
+                            write_to, write_debug, write_group, profiler)
+
+    with profiler.stage("skeletons") as stage:
+        skeletons = list(sample_skeleton_points(shape, n_objects, points_per_skeleton, interpolation, objects_seed, margin,
+                                                n_jobs=n_jobs, executor=executor))
+        stage.add_output(*[points for label, points in skeletons])
+
+    with profiler.stage("rasterize") as stage:
+        seeds = np.zeros(shape, dtype=np.int16)
+        for label, points in skeletons:
+            draw_points(seeds, points, -margin[::-1], label)
+        stage.add_output(seeds)
+    del skeletons
+
+    """
+    We generate an artificial segmentation by first filtering
+    skeleton points that are too close to each other via a non max supression
+    to avoid artifacts. A distance transform of the skeletons plus smoothed noise
+    is then used to calculate a watershed transformation with the skeletons as seeds
+    resulting in the final segmentation.
+    """
+
+    with profiler.stage("nms"):
+        suppress_non_maxima(seeds, size=4)
+    if not need_segmentation:
+        return write_sample(get_outputs(None, seeds, outputs, profiler), None, None, n_objects,
+                            write_to, write_debug, write_group, profiler)
+
+    with profiler.stage("distance_transform") as stage:
+        seeds_dt = seed_distance_transform(seeds, dtype=dtype, max_distance=max_distance)
+        if smoothed_noise is not None:
+            add_noise(seeds_dt, smoothed_noise, noise_strength)
+        stage.add_output(seeds_dt)
+    with profiler.stage("watershed") as stage:
+        segmentation = watershed(seeds_dt, seeds, backend=watershed_backend)
+        stage.add_output(segmentation)
+    if not write_debug:
+        # Release the noise and distance transform before the boundaries are computed:
+        smoothed_noise = seeds_dt = None
+
+    return write_sample(get_outputs(segmentation, seeds, outputs, profiler), smoothed_noise, seeds_dt, n_objects,
+                        write_to, write_debug, write_group, profiler)
+
+def render_neurons(shape, n_objects, points_per_skeleton, interpolation, objects_seed, margin, min_radius, max_radius, profiler,
+                   render=True):
+    """
+    Segmentation of the neurons mode of create_segmentation, together with
+    the skeletons and the distance of each object voxel to its skeleton.
+    Without render only the skeletons are drawn and None is returned for the others.
+    """
+    region, n_points = get_sampling_region(shape, points_per_skeleton, margin)
+    with profiler.stage("skeletons"):
+        neurons = [sample_neuron(region, n_points, interpolation, object_seed, min_radius, max_radius)
+                   for object_seed in objects_seed.spawn(n_objects)]
+
+    with profiler.stage("rasterize") as stage:
+        seeds = np.zeros(shape, dtype=np.int16)
+        for label, neuron in enumerate(neurons, 1):
+            draw_points(seeds, neuron.get_points(), -margin[::-1], label)
+        stage.add_output(seeds)
+    if not render:
+        return None, seeds, None
+
+    with profiler.stage("render") as stage:
+        segmentation = np.zeros(shape, dtype=np.uint16 if n_objects < 2**16 else np.uint32)
+        segmentation, distances = draw_neurons(neurons, segmentation, -margin[::-1])
+        stage.add_output(segmentation)
+    return segmentation, seeds, distances
+
+def get_outputs(segmentation, seeds, outputs, profiler):
+    """
+    The requested outputs of create_segmentation as dict,
+    the boundaries are only computed if requested.
+    """
+    boundaries = None
+    if "raw" in outputs:
+        with profiler.stage("boundaries") as stage:
+            boundaries = find_boundaries(segmentation)
+            stage.add_output(boundaries)
+    data = {"segmentation": segmentation, "skeletons": seeds, "raw": boundaries}
+    return {name: data[name] for name in outputs}
+
+def write_sample(data, smoothed_noise, seeds_dt, n_objects, write_to, write_debug, write_group, profiler):
+    """
+    Writes the outputs in data to write_to if given, see create_segmentation,
+    and returns data. Labels are stored with the dtype that holds n_objects,
+    such that all samples written with the same parameters share dtypes.
     """
-    try:
-        shape = np.array(shape)
-        if len(shape) != 3:
-            raise ValueError("Provide 3D shape.")
-
-        if np.any(shape % 2 != 0):
-            raise ValueError("All shape dimensions have to be even.")
-
-        noise = np.abs(np.random.randn(*shape))
-        smoothed_noise = gaussian_filter(noise, sigma=smoothness)
-        
-        # Sample one tree for each object and generate its skeleton:
-        max_dim = np.max(shape)
-        double_max_dim = 2*max_dim
-
-        seeds = np.zeros(2*np.array([max_dim]*len(shape)), dtype=np.int16)
-        # seeds = np.zeros([max_dim*2]*len(shape), dtype=np.uint8)
-
-        pid = mp.current_process().pid
-        seed = pid*3 + seed
-        np.random.seed(seed)
-
-        for i in range(n_objects):
-            """
-            We make the virtual volume twice as large to avoid border effects. To keep the density
-            of points the same we also increase the number of points by a factor of 8 = 2**3. Such that
-            on average we keep the same number of points per unit volume.
-            """
-            points = np.random.randint(0, double_max_dim, (3, 2**3*points_per_skeleton)).T
-            tree = Tree(points)
-            skeleton = Skeleton(tree, [1,1,1], "linear", generate_graph=False)
-            seeds = skeleton.draw(seeds, np.array([0,0,0]), i + 1)
-        
-        """
-        Cut the volume to original size (slice out middle of largevirtual volume).
-        """
-        seeds = seeds[int((double_max_dim-shape[0])/2):int((double_max_dim+shape[0])/2), int((double_max_dim-shape[1])/2):int((double_max_dim+shape[1])/2), int((double_max_dim-shape[2])/2):int((double_max_dim+shape[2])/2)]
-
-        """
-        We generate an artificial segmentation by first filtering
-        skeleton points that are too close to each other via a non max supression
-        to avoid artifacts. A distance transform of the skeletons plus smoothed noise
-        is then used to calculate a watershed transformation with the skeletons as seeds
-        resulting in the final segmentation.
-        """
-
-        seeds[maximum_filter(seeds, size=4) != seeds] = 0
-        seeds_dt = distance_transform_edt(seeds==0) + noise_strength * smoothed_noise
-        segmentation = cwatershed(seeds_dt, seeds)
-        boundaries = find_boundaries(segmentation)
-
-        if write_to is not None:
-            f = h5py.File(write_to, "w")
-            f.create_dataset("segmentation", data=segmentation.astype(np.uint64))
-            f.create_dataset("skeletons", data=seeds.astype(np.uint64))
-            f.create_dataset("boundaries", data=boundaries.astype(np.uint64))
-            f.create_dataset("smoothed_noise", data=smoothed_noise)
-            f.create_dataset("distance_transform", data=seeds_dt)
-
-        data = {"segmentation": segmentation, "skeletons": seeds, "raw": boundaries}
-
-    except:
-        raise Exception("".join(traceback.format_exception(*sys.exc_info())))
-    return data
\ No newline at end of file
+    if write_to is not None:
+        with profiler.stage("write"):
+            arrays = {{"raw": "boundaries"}.get(name, name): array for name, array in data.items()}
+            if write_debug:
+                if smoothed_noise is not None:
+                    arrays["smoothed_noise"] = smoothed_noise
+                if seeds_dt is not None:
+                    arrays["distance_transform"] = seeds_dt
+            if isinstance(write_to, SampleWriter):
+                write_to.write(arrays, group=write_group, max_label=n_objects)
+            else:
+                with SampleWriter(write_to, mode="w") as writer:
+                    writer.write(arrays, group=write_group, max_label=n_objects)
+    return data
@@ -0,0 +1,216 @@
+import numpy as np
+from scipy.spatial import Delaunay
+try:
+    from scipy.spatial import QhullError
+except ImportError:
+    from scipy.spatial.qhull import QhullError
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+
+try:
+    import graph_tool as gt
+    gt.openmp_set_num_threads(1)
+except ImportError:
+    gt = None
+
+backends = ["graph_tool", "array"]
+
+def get_backend(backend=None):
+    """
+    Validates the graph backend, None selects graph_tool
+    if it is installed and the array backend otherwise.
+    """
+    if backend is None:
+        return "graph_tool" if gt is not None else "array"
+    if not backend in backends:
+        raise ValueError("Choose between graph_tool or array backend")
+    if backend == "graph_tool" and gt is None:
+        raise ImportError("The graph_tool backend requires graph-tool to be installed")
+    return backend
+
+
+class ArrayEdge(object):
+    __slots__ = ["s", "t", "index"]
+
+    def __init__(self, s, t, index):
+        """
+        Lightweight edge descriptor of an ArrayGraph.
+        """
+        self.s = s
+        self.t = t
+        self.index = index
+
+    def source(self):
+        return self.s
+
+    def target(self):
+        return self.t
+
+    def __hash__(self):
+        return hash(self.index)
+
+    def __eq__(self, other):
+        return isinstance(other, ArrayEdge) and self.index == other.index
+
+    def __repr__(self):
+        return "ArrayEdge({}, {})".format(self.s, self.t)
+
+
+class ArrayGraph(object):
+    def __init__(self, positions, edges):
+        """
+        Undirected graph that stores vertex positions as an
+        (N, 3) int32 array and its edges as an (E, 2) array
+        with a CSR adjacency on top. It implements the subset
+        of the graph_tool.Graph interface Tree relies on.
+        """
+        self.positions = np.asarray(positions, dtype=np.int32).reshape(-1, 3)
+        self.edge_array = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.edge_ids = np.arange(len(self.edge_array))
+        self.vertex_properties = {"position": self.positions}
+        self.vp = self.vertex_properties
+        self.__build_adjacency()
+
+    def __build_adjacency(self):
+        """
+        CSR adjacency, the neighbours of v are indices[indptr[v]:indptr[v+1]]
+        and incident[indptr[v]:indptr[v+1]] holds the rows of the
+        connecting edges in edge_array, sorted by edge index.
+        """
+        n = len(self.positions)
+        rows = np.arange(len(self.edge_array))
+        sources = np.concatenate([self.edge_array[:, 0], self.edge_array[:, 1]])
+        targets = np.concatenate([self.edge_array[:, 1], self.edge_array[:, 0]])
+        rows = np.concatenate([rows, rows])
+
+        order = np.lexsort((rows, sources))
+        self.indices = targets[order]
+        self.incident = rows[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=self.indptr[1:])
+
+    def __edge(self, row):
+        return ArrayEdge(int(self.edge_array[row, 0]), int(self.edge_array[row, 1]), int(self.edge_ids[row]))
+
+    def num_vertices(self):
+        return len(self.positions)
+
+    def num_edges(self):
+        return len(self.edge_array)
+
+    def vertices(self):
+        return iter(range(len(self.positions)))
+
+    def edges(self):
+        return iter([self.__edge(row) for row in range(len(self.edge_array))])
+
+    def get_vertices(self):
+        return np.arange(len(self.positions))
+
+    def get_edges(self):
+        return self.edge_array
+
+    def get_out_degrees(self, vs):
+        return np.diff(self.indptr)[vs]
+
+    def get_out_neighbors(self, v):
+        return self.indices[self.indptr[v]:self.indptr[v+1]]
+
+    def get_out_edges(self, v):
+        neighbours = self.get_out_neighbors(v)
+        return np.stack([np.full(len(neighbours), int(v)),
+                         neighbours,
+                         self.edge_ids[self.incident[self.indptr[v]:self.indptr[v+1]]]], axis=1)
+
+    def edge(self, u, v, all_edges=False, add_missing=False):
+        u = int(u)
+        v = int(v)
+        rows = self.incident[self.indptr[u]:self.indptr[u+1]][self.get_out_neighbors(u) == v]
+        edges = [self.__edge(row) for row in rows]
+        if all_edges:
+            return edges
+        return edges[0] if edges else None
+
+    def new_vertex_property(self, value_type, val=0):
+        dtype = {"int": int, "double": float, "bool": bool}[value_type]
+        return np.full(len(self.positions), val, dtype=dtype)
+
+    def set_edge_filter(self, ep):
+        """
+        Keeps only the edges for which the boolean
+        edge property ep is True.
+        """
+        ep = np.asarray(ep, dtype=bool)[self.edge_ids]
+        self.edge_array = self.edge_array[ep]
+        self.edge_ids = self.edge_ids[ep]
+        self.__build_adjacency()
+
+    def get_csr_matrix(self):
+        n = len(self.positions)
+        return coo_matrix((np.ones(2 * len(self.edge_array), dtype=bool),
+                           (np.concatenate([self.edge_array[:, 0], self.edge_array[:, 1]]),
+                            np.concatenate([self.edge_array[:, 1], self.edge_array[:, 0]]))),
+                          shape=(n, n)).tocsr()
+
+
+def build_graph(positions, edges, backend):
+    """
+    Undirected graph of the given backend with (N, 3) vertex
+    positions and (E, 2) edges between vertex indices.
+    """
+    if backend == "array":
+        return ArrayGraph(positions, edges)
+
+    g = gt.Graph(directed=False)
+    g.add_vertex(len(positions))
+    g.add_edge_list(np.asarray(edges, dtype=np.int64).reshape(-1, 2))
+    vp_pos = g.new_vertex_property("vector<int>")
+    vp_pos.set_2d_array(np.asarray(positions, dtype=int).reshape(-1, 3).T)
+    g.vertex_properties["position"] = vp_pos
+    return g
+
+def delaunay_edges(points):
+    """
+    Returns the unique edges (i < j) of the Delaunay triangulation of points.
+    Point sets that do not span the full space (e.g. coplanar points in 3D)
+    are triangulated in the subspace they span.
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    centered = points - np.mean(points, axis=0)
+    _, s, vt = np.linalg.svd(centered, full_matrices=False)
+    rank = int(np.sum(s > 1e-9 * s[0])) if s[0] > 0 else 0
+
+    if rank <= 1 or len(points) <= rank + 1:
+        if rank <= 1:
+            # Collinear points: the triangulation is the chain along the line.
+            order = np.argsort(np.dot(centered, vt[0]))
+            return np.sort(np.stack([order[:-1], order[1:]], axis=1), axis=1)
+        # A single simplex:
+        i, j = np.triu_indices(len(points), k=1)
+        return np.stack([i, j], axis=1)
+
+    projected = np.dot(centered, vt[:rank].T)
+    try:
+        simplices = Delaunay(projected).simplices
+    except QhullError:
+        simplices = Delaunay(projected, qhull_options="QJ").simplices
+
+    i, j = np.triu_indices(simplices.shape[1], k=1)
+    edges = np.sort(np.concatenate([simplices[:, [a, b]] for a, b in zip(i, j)]), axis=1)
+    return np.unique(edges, axis=0)
+
+def minimum_spanning_tree_edges(points, edges):
+    """
+    Returns the subset of edges that forms the minimum
+    spanning tree of points with euclidean edge weights.
+    """
+    points = np.asarray(points, dtype=float)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    n = len(points)
+    weights = np.linalg.norm(points[edges[:, 0]] - points[edges[:, 1]], axis=1)
+    mst = minimum_spanning_tree(coo_matrix((weights, (edges[:, 0], edges[:, 1])), shape=(n, n))).tocoo()
+    mst_edges = np.sort(np.stack([mst.row, mst.col], axis=1), axis=1).astype(np.int64)
+    return mst_edges[np.lexsort((mst_edges[:, 1], mst_edges[:, 0]))]
@@ -1,12 +1,14 @@
 import numpy as np
-import graph_tool as gt
-gt.openmp_set_num_threads(1)
-from graph_tool.search import BFSVisitor, bfs_search
+from functools import lru_cache
+from scipy.ndimage import distance_transform_edt
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import breadth_first_order
 import pdb
 from skelerator.tree import Tree
+from skelerator.seeding import get_rng
 
 class Neuron(Tree):
-    def __init__(self, skeleton, min_radius, max_radius, verbose=False):
+    def __init__(self, skeleton, min_radius, max_radius, verbose=False, rng=None):
         """
         A neuron is a graph on 3d voxel grid (its skeleton/centerline)
         together with associated radii for each vertex indicaing
@@ -14,6 +16,7 @@ class Neuron(Tree):
         represent a volumetric description of a neuron. The radius of 
         two neighbouring voxels is constrained to be maximally
         different by 1. This leads to smooth changes of morhphology.
+        Radii are drawn from rng.
         """
         assert(min_radius>0)
         assert(max_radius>=min_radius)
@@ -22,13 +25,15 @@ class Neuron(Tree):
             raise ValueError("For neuron creation a skeleton graph is required.")
 
         self.g = self.skeleton.get_graph()
+        self.backend = self.skeleton.get_backend()
         self.source = self.skeleton.get_root_nodes()[0]
         self.points = skeleton.get_points()
         self.min_radius = min_radius
         self.max_radius = max_radius
         self.verbose = verbose
+        self.rng = get_rng(rng)
 
-        self.radius_vp = self.generate()
+        self.radii = self.generate()
 
     def generate(self):
         if self.verbose:
@@ -36,16 +41,12 @@ class Neuron(Tree):
         rrg = RandomRadiusGenerator(self.skeleton,
                                     self.source,
                                     self.min_radius,
-                                    self.max_radius)
-
-        bfs_search(self.skeleton.get_graph(), 
-                   self.source,
-                   rrg)
-
-        return rrg.radius_vp
+                                    self.max_radius,
+                                    self.rng)
+        return rrg.generate()
 
     def get_radius(self, v):
-        return int(self.radius_vp[v])
+        return int(self.radii[int(v)])
 
     def __get_bounding_box(self):
         min_point = np.min(self.points, axis=0)
@@ -59,97 +60,261 @@ class Neuron(Tree):
         return bounding_box
 
 
-    def draw(self, canvas, offset):
+    def get_radius_array(self):
+        """
+        Radii of all vertices as an (N,) int array.
+        """
+        return self.radii
+
+    def to_swc(self, path):
+        Tree.to_swc(self, path, radii=self.radii)
+
+    def draw(self, canvas, offset, mode="stamp"):
+        """
+        Draws the neuron, shifted by offset (x, y, z), into the
+        (z, y, x) ordered canvas and returns it as bool array.
+        Spheres that reach over the canvas border are clipped.
+
+        Args:
+
+        mode: "stamp" ORs one cached sphere per radius into the canvas
+              at every vertex. "distance" renders the same union of spheres
+              with one distance transform of the whole canvas per distinct
+              radius, which is faster for many vertices with large radii.
+        """
         if self.verbose:
             print("Draw neuron...")
-        canvas_size = np.shape(canvas)
-        xx,yy,zz = np.mgrid[:2*self.max_radius, :2*self.max_radius, :2*self.max_radius]
+        if not mode in ["stamp", "distance"]:
+            raise ValueError("Choose between stamp or distance mode")
+
+        canvas = np.array(canvas, dtype=bool)
+        voxels = (self.get_position_array() + np.asarray(offset, dtype=int))[:, ::-1]
+        radii = self.get_radius_array()
+
+        # Skip vertices whose sphere does not reach into the canvas:
+        visible = np.all((voxels + radii[:, None] >= 0) & (voxels - radii[:, None] < canvas.shape), axis=1)
+        voxels = voxels[visible]
+        radii = radii[visible]
+        if len(voxels) == 0:
+            return canvas
 
-        for v in self.g.vertices():
-            radius = self.get_radius(v)
-            position = self.get_position(v) + offset
+        if mode == "stamp":
+            return self.__draw_stamps(canvas, voxels, radii)
+        return self.__draw_distance(canvas, voxels, radii)
 
-            x = position[0]
-            y = position[1]
-            z = position[2]
+    def __draw_stamps(self, canvas, voxels, radii):
+        canvas_shape = np.array(canvas.shape)
+        for voxel, radius in zip(voxels, radii):
+            slices = get_stamp_slices(voxel, radius, canvas_shape)
+            if slices is not None:
+                target, source = slices
+                canvas[target] |= get_sphere_stamp(int(radius))[source]
 
-            rz = np.arange(z-self.max_radius,z+self.max_radius)
-            rx = np.arange(y-self.max_radius,y+self.max_radius)
-            ry = np.arange(x-self.max_radius,x+self.max_radius)
+        return canvas
 
-            sphere = (xx - self.max_radius)**2 + (yy - self.max_radius)**2 + (zz - self.max_radius)**2 <= radius**2
+    def __draw_distance(self, canvas, voxels, radii):
+        """
+        A voxel x is covered by some sphere iff for some radius t
+        the distance from x to the centerline voxels with radius >= t
+        is at most t. This is checked with one distance transform per
+        distinct radius, restricted to the bounding box of these
+        centerline voxels grown by t.
+        """
+        canvas_shape = np.array(canvas.shape)
+        for radius in np.unique(radii):
+            centers = voxels[radii >= radius]
+            lo = np.maximum(np.min(centers, axis=0) - radius, 0)
+            hi = np.minimum(np.max(centers, axis=0) + radius + 1, canvas_shape)
+            if np.any(hi <= lo):
+                continue
+
+            # Include centers up to radius outside of the box, their spheres reach into it:
+            box_lo = np.min(np.concatenate([centers, lo[None]]), axis=0)
+            box_hi = np.max(np.concatenate([centers + 1, hi[None]]), axis=0)
+            box_lo = np.maximum(box_lo, lo - radius)
+            box_hi = np.minimum(box_hi, hi + radius)
 
-            canvas[z-self.max_radius:z+self.max_radius, 
-                   y-self.max_radius:y+self.max_radius,
-                   x-self.max_radius:x+self.max_radius] = np.logical_or(canvas[z-self.max_radius:z+self.max_radius, 
-                                                                               y-self.max_radius:y+self.max_radius,
-                                                                               x-self.max_radius:x+self.max_radius], sphere)
-                                                            
-        return np.array(canvas, dtype=int) * 255
+            centers = centers[np.all((centers >= box_lo) & (centers < box_hi), axis=1)]
+            not_center = np.ones(box_hi - box_lo, dtype=bool)
+            not_center[tuple((centers - box_lo).T)] = False
 
+            covered = distance_transform_edt(not_center) <= radius
+            crop = tuple(slice(a, b) for a, b in zip(lo - box_lo, hi - box_lo))
+            canvas[tuple(slice(a, b) for a, b in zip(lo, hi))] |= covered[crop]
+        return canvas
 
     def get_minimal_canvas(self):
+        """
+        Returns an all zero canvas that fits the neuron
+        at maximal radius and the offset (x, y, z) to
+        draw it with.
+        """
         bounding_box = self.__get_bounding_box()
+        offset = -bounding_box["min"]
+        canvas = np.zeros((bounding_box["max"]-bounding_box["min"])[::-1], dtype=bool)
+        return canvas, offset
+
+
+def draw_neurons(neurons, canvas, offset=(0,0,0), labels=None, mode="stamp"):
+    """
+    Draws the neurons, shifted by offset (x, y, z), with the given labels
+    (default 1, 2, ...) into the (z, y, x) ordered label canvas, in place.
+    Where neurons overlap, a voxel gets the label of the neuron whose
+    centerline is closest to it; on ties the earlier neuron wins. Each neuron
+    only touches its bounding box, in which it is rendered with Neuron.draw and
+    its centerline distance is computed from distance stamps ("stamp" mode)
+    or one distance transform ("distance" mode).
+    Returns the canvas and the distance of every labelled voxel to its centerline
+    (inf for background).
+
+    Args:
+
+    mode: Rendering mode passed to Neuron.draw, also used for the centerline distance.
+    """
+    canvas_shape = np.array(canvas.shape)
+    distances = np.full(canvas.shape, np.inf, dtype=np.float32)
+    if labels is None:
+        labels = range(1, len(neurons) + 1)
+
+    for neuron, label in zip(neurons, labels):
+        positions = neuron.get_position_array() + np.asarray(offset, dtype=int)
+        voxels = positions[:, ::-1]
+        radii = neuron.get_radius_array()
+        max_radius = int(np.max(radii))
+
+        lo = np.maximum(np.min(voxels - radii[:, None], axis=0), 0)
+        hi = np.minimum(np.max(voxels + radii[:, None], axis=0) + 1, canvas_shape)
+        if np.any(hi <= lo):
+            continue
+
+        covered = neuron.draw(np.zeros(hi - lo, dtype=bool), np.asarray(offset, dtype=int) - lo[::-1], mode=mode)
+
         """
-        Handle negative min bounding box
-        by setting a new zero-point/offset
-        to the absolute value of the negative min
-        bounding box dimension
+        Every covered voxel is at most max_radius away from its closest
+        center, so the centerline distance is only needed up to max_radius.
         """
-        offset = []
-        for d in bounding_box["min"][::-1]:
-            if d<0:
-                offset.append(abs(d))
-            else:
-                offset.append(0)
+        if mode == "stamp":
+            centerline_distance = np.full(hi - lo, np.inf, dtype=distances.dtype)
+            stamp = get_distance_stamp(max_radius)
+            near = np.all((voxels >= lo - max_radius) & (voxels < hi + max_radius), axis=1)
+            for voxel in voxels[near] - lo:
+                slices = get_stamp_slices(voxel, max_radius, hi - lo)
+                if slices is not None:
+                    target, source = slices
+                    np.minimum(centerline_distance[target], stamp[source], out=centerline_distance[target])
+        else:
+            # Centers up to max_radius outside of the box can be closest to covered voxels:
+            context_lo = np.minimum(np.maximum(lo - max_radius, np.min(voxels, axis=0)), lo)
+            context_hi = np.maximum(np.minimum(hi + max_radius, np.max(voxels, axis=0) + 1), hi)
+            centers = voxels[np.all((voxels >= context_lo) & (voxels < context_hi), axis=1)]
+            not_center = np.ones(context_hi - context_lo, dtype=bool)
+            not_center[tuple((centers - context_lo).T)] = False
+            crop = tuple(slice(a, b) for a, b in zip(lo - context_lo, hi - context_lo))
+            # Compare in the precision of the buffer, such that ties are resolved consistently:
+            centerline_distance = distance_transform_edt(not_center)[crop].astype(distances.dtype)
+
+        box = tuple(slice(a, b) for a, b in zip(lo, hi))
+        closer = covered & (centerline_distance < distances[box])
+        canvas[box][closer] = label
+        distances[box][closer] = centerline_distance[closer]
+
+    return canvas, distances
 
-        # Gen canvas with all zeros
-        canvas = np.zeros((bounding_box["max"]-bounding_box["min"])[::-1], dtype=int)
-        return canvas, np.array(offset)
+def get_stamp_slices(voxel, radius, canvas_shape):
+    """
+    Slices of the canvas and of a stamp of the given radius
+    centered at voxel that overlap, None if they do not.
+    """
+    begin = voxel - radius
+    end = voxel + radius + 1
+    lo = np.maximum(begin, 0)
+    hi = np.minimum(end, canvas_shape)
+    if np.any(hi <= lo):
+        return None
+    return (tuple(slice(a, b) for a, b in zip(lo, hi)),
+            tuple(slice(a, b) for a, b in zip(lo - begin, hi - begin)))
+
+@lru_cache(maxsize=None)
+def get_distance_stamp(radius):
+    """
+    Float32 cube of side 2 * radius + 1 with the distance to its
+    center within the ball of the given radius and inf outside.
+    """
+    zz, yy, xx = np.ogrid[-radius:radius+1, -radius:radius+1, -radius:radius+1]
+    squared = zz**2 + yy**2 + xx**2
+    stamp = np.sqrt(squared).astype(np.float32)
+    stamp[squared > radius**2] = np.inf
+    stamp.flags.writeable = False
+    return stamp
 
+@lru_cache(maxsize=None)
+def get_sphere_stamp(radius):
+    """
+    Boolean cube of side 2 * radius + 1 with
+    the ball of the given radius around its center.
+    """
+    zz, yy, xx = np.ogrid[-radius:radius+1, -radius:radius+1, -radius:radius+1]
+    stamp = zz**2 + yy**2 + xx**2 <= radius**2
+    stamp.flags.writeable = False
+    return stamp
 
 
-class RandomRadiusGenerator(BFSVisitor):
+class RandomRadiusGenerator(object):
     """
-    This class implements a breadth first search
-    visitor that sets the radius of each vertex
-    that is newly discoverd to a random value
-    that varies by +- 1 or 0 from its neighbour
+    This class sets the radius of each vertex
+    to a random value that varies by +- 1 or 0 from
+    its parent in a breadth first search from source,
     while staying in the given bounds.
     """
-    def __init__(self, skeleton, source, min_radius, max_radius):
-        self.g = skeleton.get_graph()
-        self.radius_vp = self.g.new_vertex_property("int", val=0)
+    def __init__(self, skeleton, source, min_radius, max_radius, rng):
         self.skeleton = skeleton
         self.min_radius = min_radius
         self.max_radius = max_radius
-        self.source = source
+        self.source = int(source)
+        self.rng = rng
 
-    def discover_vertex(self, v):
-        if v == self.source:
-            self.radius_vp[v] = np.random.choice(np.arange(self.min_radius, self.max_radius), 1)[0]
-        else:
-            nbs = self.skeleton.get_neighbours(v)
-
-            non_zero = 0
-            nb_radius = 0
-            for u in nbs:
-                radius = self.radius_vp[u]
-                assert(radius >= 0)
-                assert(radius <= self.max_radius)
-                if radius > 0:
-                    non_zero += 1
-                    nb_radius = radius
-
-            assert(non_zero == 1)
-            assert(nb_radius>=self.min_radius)
-            assert(nb_radius<=self.max_radius)
-
-            if nb_radius == self.min_radius:
-                self.radius_vp[v] = nb_radius + 1
-
-            elif nb_radius == self.max_radius:
-                self.radius_vp[v] = nb_radius - 1
-
-            else:
-                self.radius_vp[v] = nb_radius + np.random.choice(np.array([-1,0,1]), 1)[0]
+    def generate(self):
+        """
+        Returns the radii of all vertices as (N,) int array.
+
+        The radius of a vertex is a function of the radius of its parent,
+        given by a table over the max_radius - min_radius + 1 possible
+        values that is fixed by the increment drawn for the vertex. All
+        increments are drawn at once and the tables are composed along
+        the tree by pointer jumping, such that after log2(depth) rounds
+        every vertex maps the radius of the source to its own radius.
+        """
+        n = self.skeleton.get_number_of_vertices()
+        edges = np.asarray(self.skeleton.get_edge_array(), dtype=np.int64).reshape(-1, 2)
+        adjacency = coo_matrix((np.ones(len(edges), dtype=bool), (edges[:, 0], edges[:, 1])), shape=(n, n)).tocsr()
+        order, parents = breadth_first_order(adjacency, self.source, directed=False, return_predecessors=True)
+
+        radii = np.zeros(n, dtype=int)
+        if self.max_radius == self.min_radius:
+            radii[order] = self.min_radius
+            return radii
+
+        n_states = self.max_radius - self.min_radius + 1
+        state_dtype = np.int16 if n_states < 2**15 else np.int32
+        source_state = self.rng.integers(0, n_states - 1)
+        increments = self.rng.integers(-1, 2, size=len(order) - 1)
+
+        # Tables only for the reached vertices, in bfs order with the source first:
+        index = np.full(n, -1, dtype=np.int64)
+        index[order] = np.arange(len(order))
+        ancestors = np.zeros(len(order), dtype=np.int64)
+        ancestors[1:] = index[parents[order[1:]]]
+
+        states = np.arange(n_states, dtype=state_dtype)
+        tables = np.empty((len(order), n_states), dtype=state_dtype)
+        tables[0] = states
+        tables[1:] = np.clip(states[None, :] + increments[:, None].astype(state_dtype), 0, n_states - 1)
+        tables[1:, 0] = 1
+        tables[1:, -1] = n_states - 2
+
+        while np.any(ancestors != 0):
+            tables = np.take_along_axis(tables, tables[ancestors], axis=1)
+            ancestors = ancestors[ancestors]
+
+        radii[order] = tables[:, source_state] + self.min_radius
+        return radii
@@ -0,0 +1,53 @@
+import numpy as np
+from scipy import fft
+from scipy.ndimage import gaussian_filter, fourier_gaussian, zoom
+
+def get_smoothed_noise(shape, smoothness, rng, dtype=np.float64, downsample=False, method="gaussian"):
+    """
+    Absolute white noise smoothed with a Gaussian of sigma smoothness.
+
+    Args:
+
+    rng: np.random.Generator the noise is drawn from.
+
+    dtype: np.float64 or np.float32, float32 noise is drawn from
+           a different stream and thus differs from float64 noise.
+
+    downsample: Draw and smooth the noise at a resolution reduced by
+                smoothness//2 (i.e. only for smoothness >= 4) and upsample it
+                linearly. Fluctuations are rescaled to keep the mean and standard
+                deviation of the full resolution field.
+
+    method: "gaussian" uses scipy.ndimage.gaussian_filter, "fft" multiplies
+            with the Gaussian in Fourier space, with periodic instead of
+            reflecting borders, which is faster for large sigmas.
+    """
+    shape = tuple(int(s) for s in shape)
+    if not method in ["gaussian", "fft"]:
+        raise ValueError("Choose between gaussian or fft noise smoothing")
+
+    factor = max(int(smoothness) // 2, 1) if downsample else 1
+    noise_shape = tuple(-(-s // factor) for s in shape)
+
+    noise = np.abs(rng.standard_normal(noise_shape, dtype=dtype))
+    sigma = float(smoothness) / factor
+    if method == "gaussian":
+        gaussian_filter(noise, sigma=sigma, output=noise)
+    else:
+        spectrum = fft.rfftn(noise)
+        fourier_gaussian(spectrum, sigma=sigma, n=noise_shape[-1], output=spectrum)
+        noise = fft.irfftn(spectrum, s=noise_shape).astype(dtype, copy=False)
+
+    if factor == 1:
+        return noise
+
+    """
+    Averaging over factor**3 voxels reduces the fluctuations of the
+    smoothed field by factor**(3/2) compared to the low resolution one.
+    """
+    mean = np.sqrt(2. / np.pi)
+    noise -= mean
+    noise *= factor**(-len(shape) / 2.)
+    noise += mean
+    noise = zoom(noise, np.array(shape, dtype=float) / noise_shape, order=1, mode="nearest", grid_mode=True)
+    return noise[tuple(slice(0, s) for s in shape)]
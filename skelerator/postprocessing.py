@@ -0,0 +1,74 @@
+import itertools
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+
+def suppress_non_maxima(seeds, size=4):
+    """
+    Sets every seed voxel to zero that is smaller than the maximum in its
+    window of the given size, in place. This is the same as
+    seeds[maximum_filter(seeds, size=size) != seeds] = 0
+    for non-negative seeds, but only the windows around
+    the (few) seed voxels are visited.
+    """
+    seeds = np.asarray(seeds)
+    coordinates = np.array(np.nonzero(seeds)).T
+    if len(coordinates) == 0:
+        return seeds
+    values = seeds[tuple(coordinates.T)]
+    shape = np.array(seeds.shape)
+
+    # maximum_filter centers even windows at size//2 and reflects at the border:
+    window = range(-(size//2), size - size//2)
+    suppressed = np.zeros(len(coordinates), dtype=bool)
+    for offset in itertools.product(window, repeat=seeds.ndim):
+        if not any(offset):
+            continue
+        neighbours = coordinates + offset
+        neighbours = np.where(neighbours < 0, -neighbours - 1, neighbours)
+        neighbours = np.where(neighbours >= shape, 2*shape - neighbours - 1, neighbours)
+        suppressed |= seeds[tuple(neighbours.T)] > values
+
+    seeds[tuple(coordinates[suppressed].T)] = 0
+    return seeds
+
+def seed_distance_transform(seeds, dtype=np.float64, max_distance=None, slab_size=64):
+    """
+    Euclidean distance of every voxel to the closest seed voxel.
+
+    Args:
+
+    dtype: Data type of the returned distances.
+
+    max_distance: If given, distances are clipped to max_distance. The transform
+                  is then computed in slabs of slab_size along the first axis,
+                  each extended by max_distance voxels on both sides, such that
+                  only one slab is held in double precision at a time.
+    """
+    if max_distance is None:
+        return distance_transform_edt(seeds==0).astype(dtype, copy=False)
+
+    halo = int(np.ceil(max_distance))
+    distances = np.empty(np.shape(seeds), dtype=dtype)
+    for begin in range(0, len(seeds), slab_size):
+        end = min(begin + slab_size, len(seeds))
+        context_begin = max(begin - halo, 0)
+        context_end = min(end + halo, len(seeds))
+
+        background = seeds[context_begin:context_end] == 0
+        if np.all(background):
+            distances[begin:end] = max_distance
+            continue
+        slab = distance_transform_edt(background)[begin - context_begin:end - context_begin]
+        np.minimum(slab, max_distance, out=distances[begin:end], casting="unsafe")
+    return distances
+
+def add_noise(distances, noise, noise_strength, slab_size=64):
+    """
+    Adds noise_strength * noise to distances in place, slab by slab
+    to avoid a temporary copy of the whole volume.
+    """
+    if noise_strength == 0:
+        return distances
+    for begin in range(0, len(distances), slab_size):
+        distances[begin:begin + slab_size] += noise_strength * noise[begin:begin + slab_size]
+    return distances
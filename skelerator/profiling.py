@@ -0,0 +1,108 @@
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class Stage(object):
+    def __init__(self, name):
+        """
+        Measurements of one run of a stage: its wall time in
+        seconds, the size in bytes of the arrays it produced and,
+        if allocations are traced, the peak memory allocated during it.
+        """
+        self.name = name
+        self.time = 0.
+        self.nbytes = 0
+        self.allocated = 0
+
+    def add_output(self, *arrays):
+        for array in arrays:
+            self.nbytes += array.nbytes
+
+
+class StageProfiler(object):
+    def __init__(self, trace_allocations=False):
+        """
+        Collects running statistics over all runs of named stages,
+        e.g. of create_segmentation(..., profiler=StageProfiler()).
+
+        Args:
+
+        trace_allocations: Measure the peak memory allocated in each stage
+                           with tracemalloc (numpy arrays included). This
+                           slows down allocation heavy code noticeably.
+        """
+        self.trace_allocations = trace_allocations
+        self.statistics = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        stage = Stage(name)
+        started_tracing = False
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            allocated_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.time = time.perf_counter() - start
+            if self.trace_allocations:
+                stage.allocated = tracemalloc.get_traced_memory()[1] - allocated_before
+                if started_tracing:
+                    tracemalloc.stop()
+            self.add(stage)
+
+    def add(self, stage):
+        self.merge({stage.name: {"count": 1,
+                                 "time": stage.time,
+                                 "max_time": stage.time,
+                                 "nbytes": stage.nbytes,
+                                 "max_allocated": stage.allocated}})
+
+    def merge(self, statistics):
+        """
+        Adds statistics as returned by get_statistics, e.g.
+        collected by another process, to this profiler.
+        """
+        for name, other in statistics.items():
+            if not name in self.statistics:
+                self.statistics[name] = {"count": 0, "time": 0., "max_time": 0., "nbytes": 0, "max_allocated": 0}
+            stats = self.statistics[name]
+            stats["count"] += other["count"]
+            stats["time"] += other["time"]
+            stats["nbytes"] += other["nbytes"]
+            stats["max_time"] = max(stats["max_time"], other["max_time"])
+            stats["max_allocated"] = max(stats["max_allocated"], other["max_allocated"])
+
+    def get_statistics(self):
+        """
+        Per stage number of runs, total and maximal time,
+        total size of outputs and maximal allocation.
+        """
+        return OrderedDict((name, dict(stats)) for name, stats in self.statistics.items())
+
+    def reset(self):
+        self.statistics = OrderedDict()
+
+    def summary(self):
+        lines = []
+        total = sum(stats["time"] for stats in self.statistics.values())
+        for name, stats in self.statistics.items():
+            mean = stats["time"] / stats["count"]
+            lines.append("{:<20} {:>6} runs  mean {:9.4f}s  max {:9.4f}s  {:5.1f}%  {:9.1f}MB out  {:9.1f}MB peak".format(
+                name, stats["count"], mean, stats["max_time"], 100. * stats["time"] / total if total else 0.,
+                stats["nbytes"] / stats["count"] / 1024.**2, stats["max_allocated"] / 1024.**2))
+        return "\n".join(lines)
+
+
+class NullProfiler(object):
+    """
+    Stands in for a StageProfiler if profiling is disabled.
+    """
+    @contextmanager
+    def stage(self, name):
+        yield Stage(name)
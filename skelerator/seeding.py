@@ -0,0 +1,24 @@
+import numpy as np
+
+def get_seed_sequence(seed, sample_index):
+    """
+    The seed sequence of a single sample. It is the
+    sample_index-th child that np.random.SeedSequence(seed).spawn
+    would produce, so every (seed, sample_index) pair gives an
+    independent stream that is identical on every worker.
+    """
+    return np.random.SeedSequence(seed, spawn_key=(sample_index,))
+
+def get_sample_rng(seed, sample_index):
+    return np.random.default_rng(get_seed_sequence(seed, sample_index))
+
+def get_rng(rng=None):
+    """
+    Returns a np.random.Generator for rng, which can be
+    a Generator, a SeedSequence or an int seed. If rng is None
+    the generator is seeded from the global numpy random state,
+    such that np.random.seed keeps results reproducible.
+    """
+    if rng is None:
+        return np.random.default_rng(np.random.randint(2**31))
+    return np.random.default_rng(rng)
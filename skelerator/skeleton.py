@@ -1,28 +1,59 @@
-import graph_tool as gt
-gt.openmp_set_num_threads(1)
 import numpy as np
 
-from skelerator.dda3 import DDA3
-from skelerator.crw import ConstrainedRandomWalk
+from skelerator.dda3 import draw_lines
+from skelerator.crw import random_walks
 from skelerator.tree import Tree
+from skelerator.graph import get_backend, build_graph
+from skelerator.seeding import get_rng
+
+def draw_points(canvas, points, offset, label):
+    """
+    Sets the (x, y, z) points, shifted by offset, to label in the
+    (z, y, x) ordered canvas and returns the number of points
+    that are outside of the canvas and thus clipped.
+    """
+    voxels = (np.asarray(points, dtype=int) + np.asarray(offset, dtype=int))[:, ::-1]
+    inside = np.all((voxels >= 0) & (voxels < np.shape(canvas)), axis=1)
+    canvas[tuple(voxels[inside].T)] = label
+    return len(voxels) - np.count_nonzero(inside)
 
 class Skeleton(Tree):
-    def __init__(self, tree, scaling, interpolation, verbose=False, generate_graph=True):
+    def __init__(self, tree, scaling, interpolation, verbose=False, generate_graph=True, rng=None, backend=None):
         """
         A skeleton is a graph on a 3D voxel grid where each voxel is encoded by
-        a vertex.
+        a vertex. Random interpolation draws its moves from rng. The graph
+        backend defaults to the one of the tree.
         """
         self.tree = tree
         self.scaling = scaling
         self.verbose = verbose
+        self.backend = get_backend(backend if backend is not None else tree.get_backend())
 
-        self.points, self.edge_to_line = self.__generate(interpolation)
+        self.rng = get_rng(rng)
+
+        edges, line_points, line_offsets = self.__generate(interpolation)
+        self.edge_to_line = dict(zip(edges, [line_points[line_offsets[i]:line_offsets[i+1]] for i in range(len(edges))]))
+        self.points = np.unique(line_points, axis=0)
 
         if generate_graph:
-            self.g = self.__to_graph(self.points, self.edge_to_line)
+            self.g = self.__to_graph(edges, line_points, line_offsets)
         else:
             self.g = None
 
+    @classmethod
+    def from_graph(cls, positions, edges, verbose=False, backend=None):
+        """
+        Skeleton with the given voxel positions and edges, e.g. read from
+        a file, without a tree and without interpolating anything.
+        """
+        skeleton = super(Skeleton, cls).from_graph(positions, edges, verbose=verbose, backend=backend)
+        skeleton.tree = None
+        skeleton.scaling = [1,1,1]
+        skeleton.rng = None
+        skeleton.edge_to_line = {}
+        skeleton.points = np.unique(skeleton.points, axis=0)
+        return skeleton
+
     def get_tree(self):
         return self.tree
 
@@ -35,13 +66,19 @@ class Skeleton(Tree):
     def get_graph(self):
         return self.g
 
-    def draw(self, canvas, offset, label):
-        for p in self.points:
-            try:
-                canvas[p[2],p[1],p[0]] = label
-            except IndexError:
-                print("WARNING: Provided canvas is too small to draw all skeleton points")
+    def draw(self, canvas, offset, label, return_clipped=False):
+        """
+        Draws all skeleton points, shifted by offset (x, y, z),
+        with the given label into the (z, y, x) ordered canvas.
+        Points outside of the canvas are clipped, their number is
+        returned alongside the canvas if return_clipped is set.
+        """
+        n_clipped = draw_points(canvas, self.points, offset, label)
+        if n_clipped and self.verbose:
+            print("WARNING: {} of {} skeleton points are outside of the canvas".format(n_clipped, len(self.points)))
 
+        if return_clipped:
+            return canvas, n_clipped
         return canvas
 
     def __generate(self, interpolation):
@@ -55,66 +92,52 @@ class Skeleton(Tree):
         if self.verbose:
             print("Interpolate edges {}...".format(interpolation))
 
-        points = []
-        edge_to_line = {}
-        for e in self.tree.get_edge_iterator():
-            start = self.tree.get_position(e.source())
-            end = self.tree.get_position(e.target())
-
-            if interpolation == "linear":
-                dda = DDA3(start, end, self.scaling)
-                line = dda.draw()
-            else:
-                if not np.all(self.scaling == np.array([1,1,1])):
-                    raise NotImplementedError("For random interpolation no scaling is supported")
-                rw = ConstrainedRandomWalk(start, end)
-                line = rw.walk()
-                
-            points.extend(line)
-            edge_to_line[e] = line
-
-        points_unique = np.unique(points, axis=0) 
-        return points_unique, edge_to_line
-
-
-    def __to_graph(self, points_unique, edge_to_line):
+        edges = list(self.tree.get_edge_iterator())
+        edge_positions = self.tree.get_position_array()[self.__get_edge_vertices(edges)]
+
+        if interpolation == "linear":
+            points, offsets = draw_lines(edge_positions, self.scaling)
+        else:
+            if not np.all(self.scaling == np.array([1,1,1])):
+                raise NotImplementedError("For random interpolation no scaling is supported")
+            points, offsets = random_walks(edge_positions, self.rng)
+
+        return edges, points, offsets
+
+    def __get_edge_vertices(self, edges):
+        return np.array([[int(e.source()), int(e.target())] for e in edges], dtype=int).reshape(-1, 2)
+
+    def __to_graph(self, edges, line_points, line_offsets):
         """
         Convert point interpolation to
-        gt graph to preserve neighborhood
+        a graph to preserve neighborhood
         information.
         """
         if self.verbose:
             print("Initialize skeleton graph...")
-        g = gt.Graph(directed=False)
-        g.add_vertex(len(points_unique))
-        vp_pos = g.new_vertex_property("vector<int>")
-        g.vertex_properties["position"] = vp_pos
 
         """
-        Initialize original tree vertices
-        as fixed points.
+        The original tree vertices are kept as fixed points,
+        the inner points of each interpolated edge become new
+        vertices, numbered in order of the edges, that chain
+        the two tree vertices of the edge.
         """
-        vg = 0
-        pos_to_vg = {}
-        for v in self.tree.get_vertex_iterator():
-            v_pos = self.tree.get_position(v)
-            g.vertex_properties["position"][vg] = v_pos
-            pos_to_vg[tuple(v_pos)] = vg
-            vg += 1
+        edge_vertices = self.__get_edge_vertices(edges)
+        line_vertices = np.empty(len(line_points), dtype=int)
+        inner = np.ones(len(line_points), dtype=bool)
+        inner[line_offsets[:-1]] = False
+        inner[line_offsets[1:] - 1] = False
 
-        """
-        Add edge interpolation in between each 
-        fixed tree vertex.
-        """
-        for e in self.tree.get_edge_iterator():
-            points = edge_to_line[e]
-            start_vertex = pos_to_vg[tuple(points[0])]
-            end_vertex = pos_to_vg[tuple(points[-1])]
-            for pos in points[1:-1]:
-                g.add_edge(start_vertex, vg)
-                g.vertex_properties["position"][vg] = pos
-                start_vertex = vg
-                vg += 1
-            g.add_edge(start_vertex, end_vertex)
-
-        return g
+        n_tree_vertices = self.tree.get_number_of_vertices()
+        line_vertices[inner] = n_tree_vertices + np.arange(np.count_nonzero(inner))
+        line_vertices[line_offsets[:-1]] = edge_vertices[:, 0]
+        line_vertices[line_offsets[1:] - 1] = edge_vertices[:, 1]
+
+        positions = np.concatenate([self.tree.get_position_array(), line_points[inner]])
+
+        # Consecutive points of the same line are connected:
+        connected = np.ones(max(len(line_points) - 1, 0), dtype=bool)
+        connected[line_offsets[1:-1] - 1] = False
+        graph_edges = np.stack([line_vertices[:-1][connected], line_vertices[1:][connected]], axis=1)
+
+        return build_graph(positions, graph_edges, self.backend)
@@ -0,0 +1,108 @@
+import numpy as np
+import xml.etree.ElementTree as ET
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import breadth_first_order, connected_components
+
+def write_nml(path, positions, edges, chunk_size=100000):
+    """
+    Writes a graph with (N, 3) vertex positions (x, y, z) and (E, 2)
+    vertex index edges as NML, streamed in chunks of chunk_size rows.
+    Node ids are the vertex indices plus one.
+    """
+    positions = np.asarray(positions, dtype=int).reshape(-1, 3)
+    edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" ?>\n<things>\n\t<thing>\n')
+        write_xml_rows(f, "nodes",
+                       np.column_stack([positions, np.arange(1, len(positions) + 1)]),
+                       '\t\t\t<node x="%d" y="%d" z="%d" id="%d"/>',
+                       chunk_size)
+        write_xml_rows(f, "edges", edges + 1, '\t\t\t<edge source="%d" target="%d"/>', chunk_size)
+        f.write('\t</thing>\n</things>\n')
+
+def write_xml_rows(f, tag, rows, fmt, chunk_size):
+    if len(rows) == 0:
+        f.write('\t\t<{}/>\n'.format(tag))
+        return
+    f.write('\t\t<{}>\n'.format(tag))
+    for begin in range(0, len(rows), chunk_size):
+        np.savetxt(f, rows[begin:begin + chunk_size], fmt=fmt)
+    f.write('\t\t</{}>\n'.format(tag))
+
+def read_nml(path):
+    """
+    Reads all nodes and edges of an NML file incrementally and returns
+    the (N, 3) int positions (x, y, z) and the (E, 2) edges as indices
+    into positions, which are ordered by node id.
+    """
+    ids = []
+    positions = []
+    edges = []
+    for event, element in ET.iterparse(path):
+        if element.tag == "node":
+            ids.append(int(element.get("id")))
+            positions.append([float(element.get(c)) for c in ["x", "y", "z"]])
+            element.clear()
+        elif element.tag == "edge":
+            edges.append([int(element.get("source")), int(element.get("target"))])
+            element.clear()
+
+    ids = np.array(ids, dtype=int)
+    order = np.argsort(ids)
+    positions = np.round(np.array(positions, dtype=float).reshape(-1, 3)[order]).astype(int)
+    edges = np.searchsorted(ids[order], np.array(edges, dtype=int).reshape(-1, 2))
+    return positions, edges
+
+def write_swc(path, positions, edges, radii=None, chunk_size=100000):
+    """
+    Writes a forest with (N, 3) vertex positions (x, y, z), (E, 2) vertex
+    index edges and optional (N,) radii (default 1) as SWC. Each connected
+    component is written in breadth first order from its lowest vertex,
+    such that parents precede their children. Edges closing a cycle are
+    not representable and dropped.
+    """
+    positions = np.asarray(positions, dtype=int).reshape(-1, 3)
+    edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+    n = len(positions)
+    radii = np.ones(n) if radii is None else np.asarray(radii, dtype=float)
+
+    graph = coo_matrix((np.ones(2 * len(edges), dtype=bool),
+                        (np.concatenate([edges[:, 0], edges[:, 1]]), np.concatenate([edges[:, 1], edges[:, 0]]))),
+                       shape=(n, n)).tocsr()
+    _, components = connected_components(graph, directed=False)
+    _, roots = np.unique(components, return_index=True)
+
+    order = []
+    predecessors = np.full(n, -1, dtype=int)
+    for root in roots:
+        component_order, component_predecessors = breadth_first_order(graph, root, directed=False,
+                                                                       return_predecessors=True)
+        order.append(component_order)
+        predecessors[component_order[1:]] = component_predecessors[component_order[1:]]
+    order = np.concatenate(order) if order else np.zeros(0, dtype=int)
+
+    swc_ids = np.empty(n, dtype=int)
+    swc_ids[order] = np.arange(1, n + 1)
+    parents = np.where(predecessors[order] >= 0, swc_ids[np.maximum(predecessors[order], 0)], -1)
+
+    rows = np.column_stack([np.arange(1, n + 1), np.zeros(n), positions[order], radii[order], parents])
+    with open(path, "w") as f:
+        f.write("# id type x y z radius parent\n")
+        for begin in range(0, n, chunk_size):
+            np.savetxt(f, rows[begin:begin + chunk_size], fmt=["%d", "%d", "%d", "%d", "%d", "%g", "%d"])
+
+def read_swc(path):
+    """
+    Reads an SWC file and returns the (N, 3) int positions (x, y, z),
+    the (E, 2) edges between each node and its parent as indices into
+    positions, which are ordered by node id, and the (N,) radii.
+    """
+    data = np.loadtxt(path, comments="#", ndmin=2).reshape(-1, 7)
+    data = data[np.argsort(data[:, 0])]
+    ids = data[:, 0].astype(int)
+    parents = data[:, 6].astype(int)
+
+    children = np.flatnonzero(parents != -1)
+    edges = np.stack([np.searchsorted(ids, parents[children]), children], axis=1)
+    return np.round(data[:, 2:5]).astype(int), edges, data[:, 5]
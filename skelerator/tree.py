@@ -1,15 +1,28 @@
-import graph_tool as gt
-gt.openmp_set_num_threads(1)
-from graph_tool.generation import triangulation
-from graph_tool.topology import min_spanning_tree
 import numpy as np
-from xml.dom import minidom
+
+from skelerator.graph import gt, get_backend, build_graph, delaunay_edges, minimum_spanning_tree_edges
+from skelerator.skeleton_io import write_nml, read_nml, write_swc, read_swc
+if gt is not None:
+    from graph_tool.generation import triangulation
+    from graph_tool.topology import min_spanning_tree
 
 class Tree(object):
-    def __init__(self, points, verbose=False):
+    def __init__(self, points, verbose=False, backend=None, mst=None):
         """
         A tree is a minimal spanning tree
         between a list of points in 3D.
+
+        The graph is either a graph_tool.Graph ("graph_tool")
+        or an ArrayGraph ("array") that only depends on numpy and scipy.
+        By default graph_tool is used if it is installed.
+
+        Args:
+
+        mst: How the minimal spanning tree is computed. "graph_tool" uses
+             the graph_tool triangulation and min_spanning_tree, "scipy"
+             uses scipy.spatial.Delaunay and scipy.sparse.csgraph and
+             only converts the final tree into the graph of the chosen backend.
+             Defaults to the library of the backend.
         """
         assert(type(points) == np.ndarray)
         assert(points.dtype==int)
@@ -19,9 +32,25 @@ class Tree(object):
         # Make points unique to avoid duplicate vertices:
         self.points = np.unique(points, axis=0)
         self.verbose = verbose
+        self.backend = get_backend(backend)
+        if mst is None:
+            mst = "scipy" if self.backend == "array" else "graph_tool"
+        if not mst in ["graph_tool", "scipy"]:
+            raise ValueError("Choose between graph_tool or scipy minimal spanning tree")
+        if mst == "graph_tool" and self.backend == "array":
+            raise ValueError("The graph_tool minimal spanning tree requires the graph_tool backend")
+        self.mst = mst
         self.g = self.__generate()
 
+    def get_backend(self):
+        return self.backend
+
     def get_root_nodes(self):
+        if self.backend == "array":
+            root_nodes = [int(v) for v in np.flatnonzero(self.g.get_out_degrees(self.g.get_vertices()) == 1)]
+            assert(len(root_nodes)>=2)
+            return root_nodes
+
         root_nodes = []
         for v in self.get_vertex_iterator():
             if len(self.get_incident_edges(v)) == 1:
@@ -33,57 +62,48 @@ class Tree(object):
     def get_points(self):
         return self.points
 
+    @classmethod
+    def from_graph(cls, positions, edges, verbose=False, backend=None):
+        """
+        Tree with the given (N, 3) vertex positions and (E, 2) edges
+        between vertex indices, without computing a triangulation
+        or minimal spanning tree.
+        """
+        tree = cls.__new__(cls)
+        tree.points = np.asarray(positions, dtype=int).reshape(-1, 3)
+        tree.verbose = verbose
+        tree.backend = get_backend(backend)
+        tree.mst = None
+        tree.g = build_graph(tree.points, edges, tree.backend)
+        return tree
+
+    @classmethod
+    def from_nml(cls, path, verbose=False, backend=None):
+        positions, edges = read_nml(path)
+        return cls.from_graph(positions, edges, verbose=verbose, backend=backend)
+
+    @classmethod
+    def from_swc(cls, path, verbose=False, backend=None):
+        positions, edges, radii = read_swc(path)
+        return cls.from_graph(positions, edges, verbose=verbose, backend=backend)
+
     def to_nml(self, path):
-        doc = minidom.Document()
-        annotations = doc.createElement("things")
-        doc.appendChild(annotations)
-
-        n = 1
-        nodes = doc.createElement("nodes")
-        vertex_map = {}
-        for v in self.g.vertices():
-            node = doc.createElement("node")
-            position = np.array(self.g.vertex_properties["position"][v], dtype=int)
-            self.__build_attributes(node, [["x", position[0]],
-                                           ["y", position[1]],
-                                           ["z", position[2]],
-                                           ["id", n]])
-            vertex_map[v] = n
-            nodes.appendChild(node)
-            n += 1
-
-        edges = doc.createElement("edges")
-        for e in self.g.edges():
-            source_id = vertex_map[e.source()]
-            target_id = vertex_map[e.target()]
-
-            edge = doc.createElement("edge")
-            self.__build_attributes(edge, [["source", source_id],
-                                           ["target", target_id]])
-            edges.appendChild(edge)
-
-        annotation = doc.createElement("thing")
-        annotation.appendChild(nodes)
-        annotation.appendChild(edges)
-
-        annotations.appendChild(annotation)
-        doc = doc.toprettyxml()
-
-        with open(path, "w+") as f:
-            f.write(doc)
-
-    def __build_attributes(self, xml_elem, attributes):
-        for attr in attributes:
-            try:
-                xml_elem.setAttribute(attr[0], str(attr[1]))
-            except UnicodeEncodeError:
-                xml_elem.setAttribute(attr[0], str(attr[1].encode('ascii', 'replace')))
-        return xml_elem
+        write_nml(path, self.get_position_array(), self.get_edge_array()[:, :2])
 
+    def to_swc(self, path, radii=None):
+        write_swc(path, self.get_position_array(), self.get_edge_array()[:, :2], radii)
 
     def get_position(self, v):
         return np.array(self.g.vertex_properties["position"][v], dtype=int)
 
+    def get_position_array(self):
+        """
+        Positions of all vertices as an (N, 3) int array.
+        """
+        if self.backend == "array":
+            return self.g.positions.astype(int)
+        return np.array(self.g.vertex_properties["position"].get_2d_array([0,1,2]).T, dtype=int)
+
     def get_incident_edges(self, v):
         edges = self.g.get_out_edges(v)
         edges = np.array(sorted(edges, key=lambda x: x[2]))
@@ -96,6 +116,9 @@ class Tree(object):
         return self.g.get_edge(u,v)
 
     def get_neighbours(self, v):
+        if self.backend == "array":
+            return [int(u) for u in self.g.get_out_neighbors(v)]
+
         incident_edges = self.get_incident_edges(v)
         nbs = set()
         for e in incident_edges:
@@ -140,6 +163,8 @@ class Tree(object):
     def __generate(self):
         if self.verbose:
             print("Generate tree...")
+        if self.mst == "scipy":
+            return self.__gen_scipy_tree()
         g = self.__gen_delaunay_graph()
         distance_weights = self.__get_distance_weights(g)
         tree = self.__get_minimal_spanning_tree(g, weights=distance_weights)
@@ -156,10 +181,9 @@ class Tree(object):
         if self.verbose:
             print("Generate edge weights...")
         weights = g.new_edge_property("double")
-        for e in g.edges():
-            pos_source = np.array(g.vertex_properties["position"][e.source()], dtype=float) 
-            pos_target = np.array(g.vertex_properties["position"][e.target()], dtype=float) 
-            weights[e] = np.linalg.norm(pos_source - pos_target)
+        positions = g.vertex_properties["position"].get_2d_array([0,1,2]).T
+        edges = g.get_edges([g.edge_index])
+        weights.a[edges[:, 2]] = np.linalg.norm(positions[edges[:, 0]] - positions[edges[:, 1]], axis=1)
         return weights
 
     def __get_minimal_spanning_tree(self, g, weights=None):
@@ -168,3 +192,9 @@ class Tree(object):
         tree_map = min_spanning_tree(g, weights=weights)
         g.set_edge_filter(tree_map)
         return g
+
+    def __gen_scipy_tree(self):
+        if self.verbose:
+            print("Generate delaunay triangulation and minimal spanning tree of unique points...")
+        edges = minimum_spanning_tree_edges(self.points, delaunay_edges(self.points))
+        return build_graph(self.points, edges, self.backend)
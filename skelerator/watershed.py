@@ -0,0 +1,106 @@
+import itertools
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from mahotas import cwatershed
+from skimage.segmentation import watershed as skimage_watershed
+
+backends = ["mahotas", "skimage", "blockwise"]
+
+def watershed(surface, markers, backend="mahotas", n_workers=None, block_shape=(128,128,128), halo=16):
+    """
+    Floods surface from the labeled markers, every voxel is assigned
+    the label of the marker it is reached from first. All backends
+    return int64 labels like mahotas.
+
+    Args:
+
+    backend: "mahotas" (mahotas.cwatershed), "skimage" (skimage.segmentation.watershed)
+             or "blockwise", which runs mahotas on blocks of block_shape extended by halo
+             in a pool of n_workers threads, see blockwise_watershed.
+    """
+    if backend == "mahotas":
+        # cwatershed silently produces wrong labels for non-contiguous views:
+        return cwatershed(np.ascontiguousarray(surface), np.ascontiguousarray(markers))
+    if backend == "skimage":
+        return skimage_watershed(surface, markers).astype(np.int64)
+    if backend == "blockwise":
+        return blockwise_watershed(surface, markers, block_shape, halo, n_workers)
+    raise ValueError("Choose between mahotas, skimage or blockwise watershed")
+
+def blockwise_watershed(surface, markers, block_shape=(128,128,128), halo=16, n_workers=None):
+    """
+    Watershed computed independently on blocks that are extended by halo
+    voxels on each side, of which only the block core is kept. Markers keep
+    their labels, so blocks agree across faces without relabeling, and
+    the result equals the global watershed wherever the flooding that reaches
+    a core voxel stays within the halo. The halo of blocks without any marker
+    within it is doubled until it contains one (cwatershed returns garbage
+    labels without markers). Volumes without markers stay zero.
+    """
+    shape = np.array(markers.shape)
+    block_shape = np.minimum(np.array(block_shape), shape)
+    grid = -(-shape // block_shape)
+    segmentation = np.zeros(markers.shape, dtype=np.int64)
+
+    def process(block):
+        core_begin = np.array(block) * block_shape
+        core_end = np.minimum(core_begin + block_shape, shape)
+        context = get_context_box(core_begin, core_end, shape, halo,
+                                  lambda begin, end: markers[tuple(slice(b, e) for b, e in zip(begin, end))].any())
+        if context is None:
+            return
+        begin, end = context
+        box = tuple(slice(b, e) for b, e in zip(begin, end))
+        core = tuple(slice(b, e) for b, e in zip(core_begin - begin, core_end - begin))
+        result = cwatershed(np.ascontiguousarray(surface[box]), np.ascontiguousarray(markers[box]))[core]
+        segmentation[tuple(slice(b, e) for b, e in zip(core_begin, core_end))] = result
+
+    with ThreadPoolExecutor(n_workers if n_workers is not None else os.cpu_count()) as pool:
+        list(pool.map(process, itertools.product(*[range(g) for g in grid])))
+    return segmentation
+
+def get_context_box(core_begin, core_end, shape, halo, contains_markers):
+    """
+    Begin and end of the block core_begin:core_end extended by halo voxels
+    on each side and clipped to shape. The halo is doubled until
+    contains_markers(begin, end) holds, as cwatershed returns garbage labels
+    without markers. Returns None if not even the whole volume contains any.
+    """
+    while True:
+        begin = np.maximum(core_begin - halo, 0)
+        end = np.minimum(core_end + halo, shape)
+        if contains_markers(begin, end):
+            return begin, end
+        if np.all(begin == 0) and np.all(end == shape):
+            return None
+        halo = max(2 * halo, 1)
+
+def benchmark_watersheds(surface, markers, backends=backends, repeats=3, **kwargs):
+    """
+    Runs every backend on the same surface and markers and returns, per backend,
+    the best time in seconds out of repeats runs and the fraction of voxels that
+    agree with the mahotas result.
+    """
+    reference = watershed(surface, markers, backend="mahotas")
+    results = {}
+    for backend in backends:
+        times = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            segmentation = watershed(surface, markers, backend=backend, **kwargs)
+            times.append(time.perf_counter() - start)
+        results[backend] = {"time": min(times),
+                            "agreement": float(np.mean(segmentation == reference))}
+    return results
+
+if __name__ == "__main__":
+    from scipy.ndimage import distance_transform_edt
+
+    np.random.seed(0)
+    markers = np.zeros((128,128,128), dtype=np.int16)
+    markers[tuple(np.random.randint(0, 128, (3, 100)))] = np.arange(1, 101)
+    surface = distance_transform_edt(markers==0) + np.random.rand(*markers.shape)
+    for backend, result in benchmark_watersheds(surface, markers, block_shape=(64,64,64)).items():
+        print("{}: {:.2f}s, {:.4f} agreement".format(backend, result["time"], result["agreement"]))
@@ -0,0 +1,105 @@
+import numpy as np
+import h5py
+
+def get_label_dtype(max_label):
+    """
+    Smallest unsigned integer type that holds labels up to max_label.
+    """
+    for dtype in [np.uint8, np.uint16, np.uint32, np.uint64]:
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError("Label {} exceeds uint64".format(max_label))
+
+def get_storage_dtype(array, float_dtype=np.float32, max_label=None):
+    """
+    Boolean arrays are stored as bool, non-negative integer arrays (labels)
+    with the smallest unsigned type that holds max_label and floating point
+    arrays with float_dtype. Pass the largest possible label, e.g. the
+    number of objects, to store every sample with the same dtype. If
+    max_label is None, the largest label in the array is used.
+    """
+    array = np.asarray(array)
+    if array.dtype.kind == "b":
+        return np.dtype(bool)
+    if array.dtype.kind in "iu":
+        if array.size == 0 or array.min() >= 0:
+            if max_label is None:
+                max_label = array.max() if array.size else 0
+            elif array.size and array.max() > max_label:
+                raise ValueError("Array contains labels larger than {}".format(max_label))
+            return get_label_dtype(max_label)
+        return array.dtype
+    if array.dtype.kind == "f":
+        return np.dtype(float_dtype)
+    return array.dtype
+
+
+class SampleWriter(object):
+    def __init__(self,
+                 path,
+                 mode="a",
+                 chunks=(64,64,64),
+                 compression="gzip",
+                 compression_opts=4,
+                 float_dtype=np.float32):
+        """
+        Writes samples into an HDF5 file with narrow dtypes
+        (see get_storage_dtype) as chunked, compressed datasets.
+        Can be used as a context manager that closes the file.
+
+        Args:
+
+        mode: h5py file mode, "a" appends to an existing file.
+
+        chunks: Chunk shape, clipped to the shape of each array.
+
+        compression, compression_opts: h5py compression filter and its options,
+                                       None disables compression.
+
+        float_dtype: Data type floating point arrays are stored with.
+        """
+        self.file = h5py.File(path, mode)
+        self.chunks = chunks
+        self.compression = compression
+        self.compression_opts = compression_opts if compression is not None else None
+        self.float_dtype = float_dtype
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def write(self, arrays, group=None, attrs=None, max_label=None):
+        """
+        Writes the dict of arrays as datasets of group (created if
+        missing, the file root if None) and sets the given attributes on it.
+        Label arrays are stored with the dtype of max_label, see get_storage_dtype.
+        """
+        target = self.file if group is None else self.file.require_group(group)
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            if name in target:
+                del target[name]
+            chunks = None
+            if array.ndim > 0 and array.size > 0:
+                chunks = tuple(int(min(c, s)) for c, s in zip(self.chunks, array.shape)) + array.shape[len(self.chunks):]
+            target.create_dataset(name,
+                                  data=array.astype(get_storage_dtype(array, self.float_dtype, max_label), copy=False),
+                                  chunks=chunks,
+                                  compression=self.compression if chunks is not None else None,
+                                  compression_opts=self.compression_opts if chunks is not None else None)
+        if attrs is not None:
+            for key, value in attrs.items():
+                target.attrs[key] = value
+        return target
+
+    def __contains__(self, group):
+        return group in self.file
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
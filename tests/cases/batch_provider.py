@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+import numpy as np
+
+from skelerator import BatchProvider
+
+class IterateTestCase(unittest.TestCase):
+    def runTest(self):
+        for transport in ["queue", "shared_memory"]:
+            with BatchProvider([16,16,16], [8,8,8], "linear", 2, n_workers=1, seed=0, transport=transport,
+                               outputs=["segmentation_cropped", "raw"]) as bp:
+                indices = []
+                for batch in bp.iterate(2, 3, 5, n_batches=3, timeout=60):
+                    self.assertEqual(batch.names, ["segmentation_cropped", "raw"])
+                    self.assertEqual(batch["segmentation_cropped"].shape, (2,8,8,8))
+                    self.assertEqual(batch.as_dict()["raw"].shape, (2,16,16,16))
+                    indices += batch.sample_indices
+                self.assertEqual(indices, list(range(6)))
+
+class AsyncIterateTestCase(unittest.TestCase):
+    def runTest(self):
+        async def consume(bp):
+            return [batch.sample_indices async for batch in bp.aiterate(1, 3, 5, n_batches=2, timeout=60)]
+
+        async def cancel(bp):
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(consume(bp), 0.01)
+
+        with BatchProvider([16,16,16], [8,8,8], "linear", 2, n_workers=1, seed=0) as bp:
+            self.assertEqual(asyncio.run(consume(bp)), [[0], [1]])
+
+        # Cancelling while a batch is pending releases its shared memory slot:
+        with BatchProvider([32,32,32], [8,8,8], "linear", 2, n_workers=1, seed=0,
+                           transport="shared_memory", n_slots=1, prefetch=1) as bp:
+            asyncio.run(cancel(bp))
+            self.assertEqual(len(bp.next_batch(1, 3, 5, timeout=60).sample_indices), 1)
+
+class WorkerErrorTestCase(unittest.TestCase):
+    def runTest(self):
+        # create_segmentation rejects odd shapes in the worker:
+        with BatchProvider([15,15,15], [15,15,15], "linear", 2, n_workers=1, seed=0) as bp:
+            with self.assertRaises(RuntimeError) as context:
+                bp.next_batch(1, 3, 5, timeout=60)
+            self.assertIn("ValueError", str(context.exception))
+            # The provider stays failed instead of waiting for the exited worker:
+            with self.assertRaises(RuntimeError):
+                bp.next_batch(1, 3, 5)
+            with self.assertRaises(RuntimeError):
+                next(bp.iterate(1, 3, 5))
+
+        with BatchProvider([15,15,15], [15,15,15], "linear", 2, n_workers=2, seed=0) as bp:
+            for i in range(2):
+                self.assertRaises(RuntimeError, bp.next_batch, 1, 3, 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+import json
+
+from skelerator.benchmark import run
+
+class BenchmarkReportTestCase(unittest.TestCase):
+    def runTest(self):
+        report = run(benchmarks=["tree", "create_segmentation"], shapes=[(16,16,16)],
+                     n_objects=[2], interpolations=["linear"], repeats=1)
+        self.assertEqual(len(report["records"]), 2)
+        for record in report["records"]:
+            self.assertEqual(len(record["times"]), 1)
+            self.assertTrue(record["samples_per_second"] > 0)
+            self.assertTrue(record["peak_rss_mb"] > 0)
+        stages = report["records"][1]["stages"]
+        self.assertEqual(list(stages)[:2], ["noise", "skeletons"])
+        self.assertTrue(stages["watershed"]["peak_allocated_mb"] > 0)
+        json.dumps(report)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import h5py
+
+from skelerator import create_segmentation, create_segmentation_blockwise
+
+class BlockwiseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.shape = [32, 40, 48]
+        self.n_objects = 6
+        self.points_per_skeleton = 4
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def runTest(self):
+        blockwise_single_h5 = os.path.join(self.tmp.name, "blockwise_single.h5")
+        blockwise_blocks_h5 = os.path.join(self.tmp.name, "blockwise_blocks.h5")
+        data = create_segmentation(self.shape, self.n_objects, self.points_per_skeleton,
+                                   "linear", 2, 0., seed=1)
+        create_segmentation_blockwise(self.shape, self.n_objects, self.points_per_skeleton,
+                                      "linear", 2, 0., blockwise_single_h5,
+                                      block_shape=self.shape, seed=1)
+        with h5py.File(blockwise_single_h5, "r") as f:
+            self.assertTrue(np.all(f["segmentation"][:] == data["segmentation"]))
+            self.assertTrue(np.all(f["skeletons"][:] == data["skeletons"]))
+
+        create_segmentation_blockwise(self.shape, self.n_objects, self.points_per_skeleton,
+                                      "linear", 2, 1., blockwise_single_h5,
+                                      block_shape=self.shape, seed=1)
+        create_segmentation_blockwise(self.shape, self.n_objects, self.points_per_skeleton,
+                                      "linear", 2, 1., blockwise_blocks_h5,
+                                      block_shape=[16,16,16], halo=24, seed=1)
+        with h5py.File(blockwise_single_h5, "r") as f, h5py.File(blockwise_blocks_h5, "r") as g:
+            self.assertTrue(np.all(f["segmentation"][:] == g["segmentation"][:]))
+            self.assertTrue(np.all(f["boundaries"][:] == g["boundaries"][:]))
+
+class SparseBlockwiseTestCase(unittest.TestCase):
+    def runTest(self):
+        # Few skeletons, so that most blocks plus halo contain no seed:
+        shape = (64, 64, 64)
+        datasets = {"segmentation": np.zeros(shape, dtype=np.uint64),
+                    "skeletons": np.zeros(shape, dtype=np.uint64),
+                    "boundaries": np.zeros(shape, dtype=bool)}
+        create_segmentation_blockwise(shape, 2, 4, "linear", 2, 1., datasets,
+                                      block_shape=[16,16,16], halo=4, seed=0)
+        seed_ids = set(np.unique(datasets["skeletons"])) - {0}
+        self.assertTrue(len(seed_ids) > 0)
+        self.assertTrue(set(np.unique(datasets["segmentation"])) <= seed_ids)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import os
+import shutil
+import numpy as np
+
+from skelerator import create_segmentation
+from skelerator.cache import SampleCache
+
+class SampleCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = "./cache_test"
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def runTest(self):
+        cache = SampleCache(self.directory)
+        args = ([32,32,32], 4, 5, "linear", 2, 1.0)
+        data = create_segmentation(*args, seed=1, cache=cache)
+        self.assertEqual(len(cache.get_entries()), 1)
+
+        cached = create_segmentation(*args, seed=1, cache=cache)
+        for key in data:
+            self.assertIsInstance(cached[key], np.memmap)
+            self.assertTrue(np.all(cached[key] == data[key]))
+
+        # Other parameters or missing outputs are misses:
+        create_segmentation(*args, seed=1, sample_index=1, cache=cache)
+        self.assertEqual(len(cache.get_entries()), 2)
+        self.assertIsNone(cache.get(cache.get_entries()[0][2], ["unknown"]))
+
+        # The least recently used sample is evicted first:
+        (_, _, unused), (_, size, used) = cache.get_entries()
+        os.utime(cache.get_path(unused), (0, 0))
+        cache.get(used, ["segmentation"])
+        cache.max_bytes = size
+        cache.evict()
+        self.assertEqual([entry[2] for entry in cache.get_entries()], [used])
+
+        # Samples are stored with all outputs, whatever was requested first:
+        cache.clear()
+        cache.max_bytes = 2**30
+        skeletons = create_segmentation(*args, seed=2, cache=cache, outputs=["skeletons"])
+        self.assertEqual(list(skeletons), ["skeletons"])
+        cached = create_segmentation(*args, seed=2, cache=cache)
+        self.assertEqual(len(cache.get_entries()), 1)
+        self.assertIsInstance(cached["raw"], np.memmap)
+        self.assertTrue(np.all(cached["skeletons"] == skeletons["skeletons"]))
+
+        # Numpy scalar parameters are part of the key:
+        create_segmentation(*args, seed=2, cache=cache, max_distance=np.float32(8))
+        self.assertEqual(len(cache.get_entries()), 2)
+
+if __name__ == "__main__":
+    unittest.main()
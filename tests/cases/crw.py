@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+
+from skelerator.crw import ConstrainedRandomWalk, random_walks
+
+class RandomWalksTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.edges = np.random.randint(0, 100, (50, 2, 3))
+        self.edges[0, 1] = self.edges[0, 0]
+
+    def runTest(self):
+        points, offsets = random_walks(self.edges, np.random.default_rng(0))
+        self.assertEqual(offsets[-1], len(points))
+
+        for i, (start, end) in enumerate(self.edges):
+            line = points[offsets[i]:offsets[i+1]]
+            self.assertTrue(np.all(line[0] == start))
+            self.assertTrue(np.all(line[-1] == end))
+
+            steps = np.abs(np.diff(line, axis=0))
+            self.assertTrue(np.all(np.max(steps, axis=1) == 1))
+            distances = np.sum((line - end)**2, axis=1)
+            self.assertTrue(np.all(np.diff(distances) < 0))
+
+        points_rerun, _ = random_walks(self.edges, np.random.default_rng(0))
+        self.assertTrue(np.all(points == points_rerun))
+
+class ConstrainedRandomWalkTestCase(unittest.TestCase):
+    def runTest(self):
+        rw = ConstrainedRandomWalk(np.array([0,0]), np.array([10,-4]), np.random.default_rng(0))
+        line = rw.walk()
+        self.assertEqual(line.shape[1], 2)
+        self.assertTrue(np.all(line[0] == [0,0]))
+        self.assertTrue(np.all(line[-1] == [10,-4]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import os
+import shutil
+import h5py
+
+from skelerator.dataset import generate_dataset, get_shard_path, get_sample_group
+
+class ResumeDatasetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = "./dataset_test"
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def runTest(self):
+        args = ([16,16,16], 3, 4, "linear", 2, 1.)
+        self.assertEqual(generate_dataset(self.output_dir, 5, *args, n_shards=2, n_workers=2), 5)
+
+        # Simulate a run that was killed while writing sample 3:
+        with h5py.File(get_shard_path(self.output_dir, 1), "a") as f:
+            del f[get_sample_group(3)].attrs["complete"]
+            segmentation = f[get_sample_group(1)]["segmentation"][:]
+
+        self.assertEqual(generate_dataset(self.output_dir, 6, *args, n_shards=2, n_workers=2), 2)
+        with h5py.File(get_shard_path(self.output_dir, 1), "r") as f:
+            self.assertEqual(sorted(f.keys()), [get_sample_group(i) for i in [1, 3, 5]])
+            self.assertTrue((f[get_sample_group(1)]["segmentation"][:] == segmentation).all())
+            self.assertEqual(f[get_sample_group(5)].attrs["sample_index"], 5)
+            self.assertTrue(f[get_sample_group(3)].attrs["complete"])
+
+        self.assertRaises(ValueError, generate_dataset, self.output_dir, 6, *args, n_shards=3, n_workers=1)
+
+if __name__ == "__main__":
+    unittest.main()
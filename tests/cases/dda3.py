@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+
+from skelerator.dda3 import DDA3, draw_lines, dda_round
+
+def draw_line_reference(start, end, scaling):
+    """
+    The original per step DDA3 loop, kept independent of draw_lines.
+    """
+    start = (start * scaling).astype(float)
+    end = (end * scaling).astype(float)
+    max_length = np.max(np.abs(end - start))
+    line = [dda_round(start)]
+    if max_length > 0:
+        dv = (end - start) / max_length
+        for step in range(int(max_length)):
+            line.append(dda_round((step + 1) * dv + start))
+    return np.array(line)
+
+class DrawLinesTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.edges = np.random.randint(0, 100, (50, 2, 3))
+        self.edges[0, 1] = self.edges[0, 0]
+
+    def runTest(self):
+        for scaling in [np.array([1,1,1]), np.array([1,1,2.5])]:
+            points, offsets = draw_lines(self.edges, scaling)
+            self.assertEqual(len(offsets), len(self.edges) + 1)
+            self.assertEqual(offsets[-1], len(points))
+
+            for i, (start, end) in enumerate(self.edges):
+                line = draw_line_reference(start, end, scaling)
+                self.assertTrue(np.all(points[offsets[i]:offsets[i+1]] == line))
+                self.assertTrue(np.all(np.array(DDA3(start, end, scaling).draw()) == line))
+
+        points, offsets = draw_lines(self.edges)
+        self.assertTrue(np.all(points[offsets[:-1]] == self.edges[:, 0]))
+        self.assertTrue(np.all(points[offsets[1:] - 1] == self.edges[:, 1]))
+
+if __name__ == "__main__":
+    unittest.main()
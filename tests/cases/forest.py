@@ -0,0 +1,67 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import h5py
+from scipy.ndimage import distance_transform_edt
+
+from skelerator import create_segmentation
+
+class ParallelObjectsTestCase(unittest.TestCase):
+    def runTest(self):
+        serial = create_segmentation([32,32,32], 6, 5, "random", 2, 1.0, seed=1)
+        for executor in ["thread", "process"]:
+            parallel = create_segmentation([32,32,32], 6, 5, "random", 2, 1.0, seed=1,
+                                           n_jobs=2, executor=executor)
+            for key in serial:
+                self.assertTrue(np.all(serial[key] == parallel[key]))
+
+class CompactDistanceTransformTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def runTest(self):
+        forest_compact_h5 = os.path.join(self.tmp.name, "forest_compact.h5")
+        # Without noise the written distance transform is the bare one:
+        data = create_segmentation([32,32,32], 6, 5, "linear", 2, 0., seed=1, dtype=np.float32, max_distance=3,
+                                   write_to=forest_compact_h5, write_debug=True)
+        self.assertEqual(data["segmentation"].shape, (32,32,32))
+        self.assertTrue(np.all(data["segmentation"] > 0))
+
+        with h5py.File(forest_compact_h5, "r") as f:
+            distances = f["distance_transform"][:]
+            self.assertTrue(np.all(f["skeletons"][:] == data["skeletons"]))
+        expected = distance_transform_edt(data["skeletons"] == 0)
+        self.assertTrue(np.any(expected > 3))
+        within = expected <= 3
+        self.assertTrue(np.allclose(distances[within], expected[within]))
+        self.assertTrue(np.all(distances[~within] == 3))
+
+        data = create_segmentation([32,32,32], 6, 5, "linear", 2, 1.0, seed=1, dtype=np.float32, max_distance=8)
+        self.assertTrue(np.all(data["segmentation"] > 0))
+
+class NeuronsModeTestCase(unittest.TestCase):
+    def runTest(self):
+        data = create_segmentation([32,32,32], 6, 5, "linear", 2, 1.0, seed=1,
+                                   mode="neurons", min_radius=1, max_radius=3)
+        self.assertEqual(data["segmentation"].dtype, np.uint16)
+        self.assertTrue(np.any(data["segmentation"] == 0))
+        skeletons = data["skeletons"] > 0
+        self.assertTrue(np.all(data["segmentation"][skeletons] > 0))
+
+class SelectedOutputsTestCase(unittest.TestCase):
+    def runTest(self):
+        for mode in ["watershed", "neurons"]:
+            full = create_segmentation([32,32,32], 6, 5, "linear", 2, 1.0, seed=1, mode=mode)
+            for outputs in [["segmentation"], ["skeletons"], ["raw", "skeletons"]]:
+                data = create_segmentation([32,32,32], 6, 5, "linear", 2, 1.0, seed=1, mode=mode, outputs=outputs)
+                self.assertEqual(sorted(data), sorted(outputs))
+                for key in outputs:
+                    self.assertTrue(np.all(data[key] == full[key]))
+        self.assertRaises(ValueError, create_segmentation, [32,32,32], 6, 5, "linear", 2, 1.0, outputs=["boundaries"])
+
+if __name__ == "__main__":
+    unittest.main()
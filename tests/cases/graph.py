@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+
+from skelerator.graph import ArrayGraph, delaunay_edges, minimum_spanning_tree_edges
+
+class DelaunayEdgesTestCase(unittest.TestCase):
+    def runTest(self):
+        collinear = np.array([[0,0,0], [0,0,30], [0,0,10], [0,0,20]])
+        edges = delaunay_edges(collinear)
+        self.assertEqual(sorted(map(tuple, edges)), [(0,2), (1,3), (2,3)])
+
+        coplanar = np.array([[0,0,0], [0,100,0], [0,500,0], [0,800,0], [0,500,100]])
+        edges = minimum_spanning_tree_edges(coplanar, delaunay_edges(coplanar))
+        self.assertEqual(sorted(map(tuple, edges)), [(0,1), (1,2), (2,3), (2,4)])
+
+        np.random.seed(0)
+        points = np.unique(np.random.randint(0, 100, (200, 3)), axis=0)
+        edges = minimum_spanning_tree_edges(points, delaunay_edges(points))
+        self.assertEqual(len(edges), len(points) - 1)
+
+class ArrayGraphTestCase(unittest.TestCase):
+    def runTest(self):
+        positions = np.array([[0,0,0], [1,0,0], [2,0,0], [1,1,0]])
+        g = ArrayGraph(positions, [[0,1], [1,2], [3,1]])
+        self.assertEqual(g.num_vertices(), 4)
+        self.assertEqual(g.num_edges(), 3)
+        self.assertEqual(sorted(g.get_out_neighbors(1)), [0, 2, 3])
+        self.assertEqual(list(g.get_out_degrees(g.get_vertices())), [1, 3, 1, 1])
+        self.assertEqual(list(g.get_out_edges(1)[:, 2]), [0, 1, 2])
+        self.assertEqual(len(g.edge(1, 3, all_edges=True)), 1)
+        self.assertEqual(len(g.edge(0, 3, all_edges=True)), 0)
+        self.assertTrue(np.all(g.vertex_properties["position"][3] == [1,1,0]))
+
+        g.set_edge_filter(np.array([True, False, True]))
+        self.assertEqual(g.num_edges(), 2)
+        self.assertEqual(sorted(g.get_out_neighbors(1)), [0, 3])
+        self.assertEqual([e.index for e in g.edges()], [0, 2])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,7 @@ from tree import SmallTreeTestCase
 from skelerator import Skeleton
 from skelerator import Tree
 from skelerator import Neuron
+from skelerator.neuron import draw_neurons
 import h5py
 import pdb
 
@@ -74,6 +75,52 @@ class DrawTestCaseRandom(SmallTreeTestCase):
         f.create_dataset("neuron", data=canvas)
         f.close()
 
-        
+class DrawModesTestCase(unittest.TestCase):
+    def runTest(self):
+        points = np.array([[0,0,0], [30,0,0], [30,40,0], [10,20,30]])
+        skeleton = Skeleton(Tree(points), [1,1,1], "linear")
+        neuron = Neuron(skeleton, 2, 6, rng=np.random.default_rng(0))
+
+        voxels = neuron.get_position_array()[:, ::-1]
+        radii = neuron.get_radius_array()
+
+        canvas, offset = neuron.get_minimal_canvas()
+        # Also draw into a canvas that cuts through the neuron:
+        for canvas, offset in [(canvas, offset), (np.zeros((20, 30, 25), dtype=bool), np.array([-10, -15, -5]))]:
+            zz, yy, xx = np.indices(canvas.shape)
+            expected = np.zeros(canvas.shape, dtype=bool)
+            for (z, y, x), r in zip(voxels + offset[::-1], radii):
+                expected |= (zz - z)**2 + (yy - y)**2 + (xx - x)**2 <= r**2
+
+            stamped = neuron.draw(canvas, offset)
+            self.assertEqual(stamped.dtype, bool)
+            self.assertTrue(np.all(stamped == expected))
+            self.assertTrue(np.all(neuron.draw(canvas, offset, mode="distance") == expected))
+
+class DrawNeuronsTestCase(unittest.TestCase):
+    def runTest(self):
+        rng = np.random.default_rng(0)
+        neurons = [Neuron(Skeleton(Tree(rng.integers(-5, 35, (5, 3))), [1,1,1], "linear", rng=rng), 1, 4, rng=rng)
+                   for i in range(4)]
+        shape = (30, 30, 30)
+
+        # Label of the closest centerline among all neurons covering a voxel:
+        zz, yy, xx = np.indices(shape)
+        expected = np.zeros(shape, dtype=np.uint16)
+        closest = np.full(shape, np.inf, dtype=np.float32)
+        for label, neuron in enumerate(neurons, 1):
+            covered = neuron.draw(np.zeros(shape, dtype=bool), [0,0,0])
+            distance = np.full(shape, np.inf, dtype=np.float32)
+            for z, y, x in neuron.get_position_array()[:, ::-1]:
+                distance = np.minimum(distance, np.sqrt((zz - z)**2 + (yy - y)**2 + (xx - x)**2).astype(np.float32))
+            closer = covered & (distance < closest)
+            expected[closer] = label
+            closest[closer] = distance[closer]
+
+        for mode in ["stamp", "distance"]:
+            canvas, distances = draw_neurons(neurons, np.zeros(shape, dtype=np.uint16), mode=mode)
+            self.assertTrue(np.all(canvas == expected))
+            self.assertTrue(np.all(distances == closest))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from skelerator.noise import get_smoothed_noise
+
+class SmoothedNoiseTestCase(unittest.TestCase):
+    def runTest(self):
+        shape = (48, 40, 32)
+        noise = get_smoothed_noise(shape, 2, np.random.default_rng(0))
+        expected = gaussian_filter(np.abs(np.random.default_rng(0).standard_normal(shape)), sigma=2)
+        self.assertTrue(np.all(noise == expected))
+
+        core = (slice(16, 32), slice(12, 28), slice(8, 24))
+        for kwargs in [{"dtype": np.float32}, {"downsample": True}, {"method": "fft"}]:
+            noise = get_smoothed_noise(shape, 4, np.random.default_rng(0), **kwargs)
+            self.assertEqual(noise.shape, shape)
+            self.assertEqual(noise.dtype, kwargs.get("dtype", np.float64))
+            self.assertAlmostEqual(np.mean(noise), np.sqrt(2 / np.pi), places=2)
+
+        reference = get_smoothed_noise(shape, 4, np.random.default_rng(0))
+        noise = get_smoothed_noise(shape, 4, np.random.default_rng(0), method="fft")
+        self.assertTrue(np.corrcoef(noise[core].ravel(), reference[core].ravel())[0, 1] > 0.99)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+import numpy as np
+from scipy.ndimage import maximum_filter, distance_transform_edt
+
+from skelerator.postprocessing import suppress_non_maxima, seed_distance_transform
+
+class SuppressNonMaximaTestCase(unittest.TestCase):
+    def runTest(self):
+        np.random.seed(0)
+        seeds = np.random.randint(1, 50, (17, 9, 12)) * (np.random.rand(17, 9, 12) < 0.2)
+        expected = np.copy(seeds)
+        expected[maximum_filter(expected, size=4) != expected] = 0
+        self.assertTrue(np.all(suppress_non_maxima(seeds) == expected))
+
+class BoundedDistanceTransformTestCase(unittest.TestCase):
+    def runTest(self):
+        np.random.seed(0)
+        seeds = (np.random.rand(40, 20, 20) < 0.001).astype(np.uint32)
+        seeds[:15] = 0
+        expected = distance_transform_edt(seeds==0)
+
+        distances = seed_distance_transform(seeds, dtype=np.float32, max_distance=6, slab_size=8)
+        self.assertEqual(distances.dtype, np.float32)
+        self.assertTrue(np.allclose(distances, np.minimum(expected, 6)))
+        self.assertTrue(np.allclose(seed_distance_transform(seeds), expected))
+
+if __name__ == "__main__":
+    unittest.main()
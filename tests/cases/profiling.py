@@ -0,0 +1,29 @@
+import unittest
+import numpy as np
+
+from skelerator import create_segmentation
+from skelerator.profiling import StageProfiler
+
+class StageProfilerTestCase(unittest.TestCase):
+    def runTest(self):
+        profiler = StageProfiler(trace_allocations=True)
+        for i in range(2):
+            create_segmentation([32,32,32], 4, 5, "linear", 2, 1.0, seed=0, sample_index=i, profiler=profiler)
+
+        statistics = profiler.get_statistics()
+        self.assertEqual(list(statistics.keys()), ["noise", "skeletons", "rasterize", "nms",
+                                                   "distance_transform", "watershed", "boundaries"])
+        for stats in statistics.values():
+            self.assertEqual(stats["count"], 2)
+            self.assertTrue(stats["time"] >= stats["max_time"] > 0)
+        self.assertEqual(statistics["noise"]["nbytes"], 2 * 32**3 * 8)
+        self.assertTrue(statistics["noise"]["max_allocated"] >= 32**3 * 8)
+
+        aggregate = StageProfiler()
+        aggregate.merge(statistics)
+        aggregate.merge(statistics)
+        self.assertEqual(aggregate.get_statistics()["watershed"]["count"], 4)
+        self.assertEqual(len(aggregate.summary().split("\n")), len(statistics))
+
+if __name__ == "__main__":
+    unittest.main()
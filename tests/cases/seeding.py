@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+from skelerator.seeding import get_seed_sequence, get_sample_rng, get_rng
+
+class SampleRngTestCase(unittest.TestCase):
+    def runTest(self):
+        children = np.random.SeedSequence(42).spawn(3)
+        for i, child in enumerate(children):
+            self.assertEqual(get_seed_sequence(42, i).generate_state(4).tolist(),
+                             child.generate_state(4).tolist())
+
+        a = get_sample_rng(42, 0).integers(0, 2**31, 10)
+        b = get_sample_rng(42, 0).integers(0, 2**31, 10)
+        c = get_sample_rng(42, 1).integers(0, 2**31, 10)
+        self.assertTrue(np.all(a == b))
+        self.assertFalse(np.all(a == c))
+
+class GlobalRngTestCase(unittest.TestCase):
+    def runTest(self):
+        np.random.seed(0)
+        a = get_rng().integers(0, 2**31, 10)
+        np.random.seed(0)
+        b = get_rng().integers(0, 2**31, 10)
+        self.assertTrue(np.all(a == b))
+
+        rng = np.random.default_rng(0)
+        self.assertTrue(get_rng(rng) is rng)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -76,6 +76,44 @@ class SkeletonTestCaseRandom(SmallTreeTestCase):
         self.assertEqual(n_leaves, self.expected_leaves)
         self.assertEqual(n_branches, self.expected_branches)
         skeleton.to_nml("./small_skeleton_random.nml")
- 
+
+class SkeletonTestCaseArrayBackend(SmallTreeTestCase):
+    def runTest(self):
+        tree = Tree(self.points, backend="array")
+        skeleton = Skeleton(tree, [1,1,1], "linear")
+        self.assertEqual(skeleton.get_backend(), "array")
+
+        skeleton_points = skeleton.get_points()
+        self.assertEqual(skeleton.get_number_of_vertices(), len(skeleton_points))
+        self.assertEqual(skeleton.get_number_of_edges(), len(skeleton_points) - 1)
+        for v in skeleton.get_vertex_iterator():
+            self.assertTrue(skeleton.get_position(v) in skeleton_points)
+            for u in skeleton.get_neighbours(v):
+                self.assertEqual(np.max(np.abs(skeleton.get_position(u) - skeleton.get_position(v))), 1)
+
+        self.assertEqual(sorted(skeleton.get_root_nodes()), sorted(tree.get_root_nodes()))
+        degrees = [len(skeleton.get_neighbours(v)) for v in skeleton.get_vertex_iterator()]
+        self.assertEqual(degrees.count(1), self.expected_leaves)
+        self.assertEqual(degrees.count(3), self.expected_branches)
+
+class SkeletonDrawTestCase(SmallTreeTestCase):
+    def runTest(self):
+        tree = Tree(self.points)
+        skeleton = Skeleton(tree, [1,1,1], "linear")
+        points = skeleton.get_points()
+
+        canvas = np.zeros((101, 801, 1), dtype=np.uint8)
+        canvas, n_clipped = skeleton.draw(canvas, np.array([0,0,0]), 3, return_clipped=True)
+        self.assertEqual(n_clipped, 0)
+        self.assertEqual(np.count_nonzero(canvas == 3), len(points))
+
+        # Shifted by -400 in y only points with y >= 400 remain and nothing wraps around:
+        canvas = np.zeros((101, 801, 1), dtype=np.uint8)
+        canvas, n_clipped = skeleton.draw(canvas, np.array([0,-400,0]), 1, return_clipped=True)
+        self.assertEqual(n_clipped, np.count_nonzero(points[:, 1] < 400))
+        self.assertEqual(np.count_nonzero(canvas), len(points) - n_clipped)
+        self.assertEqual(canvas[0, 100, 0], 1)
+        self.assertEqual(canvas[0, 800, 0], 0)
+
 if __name__ == "__main__":
     unittest.main()
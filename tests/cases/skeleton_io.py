@@ -0,0 +1,58 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+
+from skelerator import Tree, Skeleton, Neuron
+from skelerator.skeleton_io import write_nml, read_nml, write_swc, read_swc
+
+class RoundTripTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def runTest(self):
+        roundtrip_nml = os.path.join(self.tmp.name, "roundtrip.nml")
+        roundtrip_swc = os.path.join(self.tmp.name, "roundtrip.swc")
+        positions = np.array([[0,0,0], [5,0,0], [5,5,0], [9,9,9], [9,9,8]])
+        edges = np.array([[0,1], [2,1], [3,4]])
+
+        write_nml(roundtrip_nml, positions, edges)
+        nml_positions, nml_edges = read_nml(roundtrip_nml)
+        self.assertTrue(np.all(nml_positions == positions))
+        self.assertTrue(np.all(nml_edges == edges))
+
+        write_swc(roundtrip_swc, positions, edges, radii=[1,2,3,4,5])
+        swc_positions, swc_edges, radii = read_swc(roundtrip_swc)
+        self.assertTrue(np.all(swc_positions == positions))
+        self.assertEqual(sorted(map(tuple, np.sort(swc_edges, axis=1))), [(0,1), (1,2), (3,4)])
+        self.assertTrue(np.all(radii == [1,2,3,4,5]))
+
+class SkeletonFromFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def runTest(self):
+        skeleton_io_nml = os.path.join(self.tmp.name, "skeleton_io.nml")
+        skeleton_io_swc = os.path.join(self.tmp.name, "skeleton_io.swc")
+        np.random.seed(0)
+        skeleton = Skeleton(Tree(np.random.randint(0, 50, (10, 3))), [1,1,1], "random")
+        skeleton.to_nml(skeleton_io_nml)
+        neuron = Neuron(skeleton, 1, 3)
+        neuron.to_swc(skeleton_io_swc)
+
+        for loaded in [Skeleton.from_nml(skeleton_io_nml), Skeleton.from_swc(skeleton_io_swc)]:
+            self.assertTrue(np.all(loaded.get_points() == skeleton.get_points()))
+            self.assertEqual(loaded.get_number_of_edges(), skeleton.get_number_of_edges())
+            self.assertEqual(len(loaded.get_root_nodes()), len(skeleton.get_root_nodes()))
+
+        tree = Tree.from_nml(skeleton_io_nml)
+        self.assertEqual(tree.get_number_of_vertices(), skeleton.get_number_of_vertices())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
 import numpy as np
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial.distance import pdist, squareform
 from skelerator import Tree
 
 class SmallTreeTestCase(unittest.TestCase):
@@ -32,5 +34,26 @@ class TreeGenTestCase(SmallTreeTestCase):
         self.assertEqual(n_branches, self.expected_branches)
         tree.to_nml("./small_tree.nml")
 
+class ScipyTreeTestCase(SmallTreeTestCase):
+    def runTest(self):
+        tree = Tree(self.points, mst="scipy")
+        self.assertEqual(tree.get_number_of_vertices(), self.unique_points)
+        self.assertEqual(tree.get_number_of_edges(), self.expected_edges)
+
+        # The Euclidean minimal spanning tree is a subgraph of the Delaunay
+        # graph, so both trees have the weight of the minimal spanning tree
+        # of the complete graph, which is unique even if the tree is not:
+        np.random.seed(0)
+        points = np.random.randint(0, 1000, (100, 3))
+        reference = minimum_spanning_tree(squareform(pdist(np.unique(points, axis=0)))).sum()
+        for tree in [Tree(points), Tree(points, mst="scipy")]:
+            positions = tree.get_position_array()
+            edges = np.array([[int(e.source()), int(e.target())] for e in tree.get_edge_iterator()])
+            self.assertEqual(len(edges), len(positions) - 1)
+            weight = np.linalg.norm(positions[edges[:, 0]] - positions[edges[:, 1]], axis=1).sum()
+            self.assertAlmostEqual(weight, reference)
+
+        self.assertRaises(ValueError, Tree, points, mst="networkx")
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+from mahotas import cwatershed
+
+from skelerator.watershed import watershed, benchmark_watersheds
+
+class WatershedBackendsTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.markers = np.zeros((40, 30, 20), dtype=np.int16)
+        self.markers[tuple(np.random.randint(0, [[40],[30],[20]], (3, 30)))] = np.arange(1, 31)
+        self.surface = distance_transform_edt(self.markers==0) + np.random.rand(*self.markers.shape)
+
+    def runTest(self):
+        reference = cwatershed(self.surface, self.markers)
+        for backend in ["mahotas", "skimage", "blockwise"]:
+            segmentation = watershed(self.surface, self.markers, backend=backend, block_shape=(8,8,8), halo=8)
+            self.assertEqual(segmentation.dtype, np.int64)
+            self.assertTrue(np.all(segmentation != 0))
+            self.assertTrue(np.mean(segmentation == reference) > 0.9)
+
+        segmentation = watershed(self.surface, self.markers, backend="blockwise", block_shape=(8,8,8), halo=40)
+        self.assertTrue(np.all(segmentation == reference))
+
+        view = (slice(5, 35), slice(3, 27), slice(2, 18))
+        segmentation = watershed(self.surface[view], self.markers[view], backend="mahotas")
+        self.assertTrue(np.all(segmentation == cwatershed(np.copy(self.surface[view]), np.copy(self.markers[view]))))
+
+        # Most blocks and their halos contain no marker:
+        markers = np.zeros((32, 32, 32), dtype=np.int16)
+        markers[3, 3, 3] = 7
+        surface = np.random.rand(32, 32, 32)
+        segmentation = watershed(surface, markers, backend="blockwise", block_shape=(8,8,8), halo=2)
+        self.assertTrue(np.all(segmentation == watershed(surface, markers, backend="mahotas")))
+        markers[25, 20, 15] = 9
+        segmentation = watershed(surface, markers, backend="blockwise", block_shape=(8,8,8), halo=2)
+        self.assertEqual(set(np.unique(segmentation)), {7, 9})
+        self.assertTrue(np.all(watershed(surface, 0 * markers, backend="blockwise") == 0))
+
+        results = benchmark_watersheds(self.surface, self.markers, repeats=1)
+        self.assertEqual(results["mahotas"]["agreement"], 1.)
+        self.assertRaises(ValueError, watershed, self.surface, self.markers, backend="random_walker")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import h5py
+
+from skelerator import create_segmentation
+from skelerator.writer import SampleWriter, get_label_dtype
+
+class SampleWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def runTest(self):
+        writer_single_h5 = os.path.join(self.tmp.name, "writer_single.h5")
+        writer_multiple_h5 = os.path.join(self.tmp.name, "writer_multiple.h5")
+        writer_labels_h5 = os.path.join(self.tmp.name, "writer_labels.h5")
+        self.assertEqual(get_label_dtype(255), np.uint8)
+        self.assertEqual(get_label_dtype(256), np.uint16)
+        self.assertEqual(get_label_dtype(70000), np.uint32)
+
+        data = create_segmentation([32,32,32], 4, 5, "linear", 2, 1.0, write_to=writer_single_h5)
+        with h5py.File(writer_single_h5, "r") as f:
+            self.assertEqual(sorted(f.keys()), ["boundaries", "segmentation", "skeletons"])
+            self.assertEqual(f["segmentation"].dtype, np.uint8)
+            self.assertEqual(f["boundaries"].dtype, bool)
+            self.assertEqual(f["segmentation"].compression, "gzip")
+            self.assertTrue(np.all(f["segmentation"][:] == data["segmentation"]))
+            self.assertTrue(np.all(f["skeletons"][:] == data["skeletons"]))
+
+        with SampleWriter(writer_multiple_h5, mode="w", chunks=(16,16,16)) as writer:
+            for i in range(3):
+                create_segmentation([32,32,32], 4, 5, "linear", 2, 1.0, sample_index=i, write_to=writer,
+                                    write_debug=True, write_group="sample_{}".format(i))
+        with h5py.File(writer_multiple_h5, "r") as f:
+            self.assertEqual(sorted(f.keys()), ["sample_0", "sample_1", "sample_2"])
+            self.assertEqual(f["sample_2/distance_transform"].dtype, np.float32)
+            self.assertEqual(f["sample_2/smoothed_noise"].chunks, (16,16,16))
+
+        # The label dtype follows the largest possible label, not the labels present in each array:
+        with SampleWriter(writer_labels_h5, mode="w") as writer:
+            writer.write({"segmentation": np.array([1, 2])}, group="sample_0", max_label=300)
+            writer.write({"segmentation": np.array([1, 300])}, group="sample_1", max_label=300)
+            self.assertRaises(ValueError, writer.write, {"segmentation": np.array([301])}, max_label=300)
+        with h5py.File(writer_labels_h5, "r") as f:
+            self.assertEqual(f["sample_0/segmentation"].dtype, np.uint16)
+            self.assertEqual(f["sample_1/segmentation"].dtype, np.uint16)
+
+if __name__ == "__main__":
+    unittest.main()